@@ -0,0 +1,26 @@
+-- =========================================================
+-- 001: per-station ingest checkpoints
+-- One row per (target hour, station) once its rows are committed.
+-- A retried / restarted ingest skips stations already checkpointed
+-- for the same target hour and adopts their rows.
+-- =========================================================
+
+create table if not exists public.ops_ingest_checkpoint (
+  target_hour          timestamptz not null,
+  station_external_id  text        not null,
+  run_id               uuid        not null references public.ops_job_run (run_id),
+  rows_written         integer     not null default 0,
+  completed_at         timestamptz not null default now(),
+  primary key (target_hour, station_external_id)
+);
+
+create index if not exists ix_ops_ingest_checkpoint_run_id
+  on public.ops_ingest_checkpoint (run_id);
+
+alter table public.ops_ingest_checkpoint enable row level security;
+
+create policy ops_ingest_checkpoint_ops
+  on public.ops_ingest_checkpoint
+  for all
+  using (is_role('ops'))
+  with check (is_role('ops'));
@@ -0,0 +1,8 @@
+-- =========================================================
+-- 002: free-form per-run counters on ops_job_run
+-- e.g. ingest response-cache hits/misses. Jobs merge keys in with
+--   run_stats = coalesce(run_stats, '{}') || <new keys>
+-- =========================================================
+
+alter table public.ops_job_run
+  add column if not exists run_stats jsonb;
@@ -0,0 +1,52 @@
+-- =========================================================
+-- 003: compact raw payload storage
+-- jobs.ingest --compact-payload stores the context shared by every
+-- metric of a station-hour (provider, station, lat/lon, observed_at)
+-- once per (ingest run, station, hour); raw_observations.source_payload
+-- then only keeps the metric slice (field, metric_code, unit, value).
+-- vw_raw_observations_full rebuilds the full payload for audit.
+-- =========================================================
+
+create table if not exists public.raw_observation_context (
+  ingest_run_id        uuid        not null references public.ops_job_run (run_id),
+  source               text        not null,
+  station_external_id  text        not null,
+  observed_at          timestamptz not null,
+  context              jsonb       not null,
+  primary key (ingest_run_id, source, station_external_id, observed_at)
+);
+
+alter table public.raw_observation_context enable row level security;
+
+create policy raw_observation_context_read_ops
+  on public.raw_observation_context
+  for select
+  using (is_role('ops'));
+
+create policy raw_observation_context_write_ops
+  on public.raw_observation_context
+  for all
+  using (is_role('ops'))
+  with check (is_role('ops'));
+
+create or replace view public.vw_raw_observations_full
+with (security_invoker = true) as
+select
+  r.id,
+  r.source,
+  r.station_external_id,
+  r.observed_at,
+  r.metric_code,
+  r.value_num,
+  r.value_text,
+  r.unit,
+  r.quality_flag,
+  coalesce(c.context, '{}'::jsonb) || r.source_payload as source_payload,
+  r.ingested_at,
+  r.ingest_run_id
+from public.raw_observations r
+left join public.raw_observation_context c
+  on c.ingest_run_id = r.ingest_run_id
+ and c.source = r.source
+ and c.station_external_id = r.station_external_id
+ and c.observed_at = r.observed_at;
@@ -0,0 +1,14 @@
+-- =========================================================
+-- 004: indexes for the watermark-driven transform
+-- (python -m jobs.transform_fact --incremental)
+--
+-- raw rows past the watermark are found by ingested_at; the last
+-- watermark and the ingest runs closed inside the window are found by
+-- job_name + ended_at, so neither lookup grows with history
+-- =========================================================
+
+create index if not exists ix_raw_observations_ingested_at
+  on public.raw_observations (ingested_at);
+
+create index if not exists ix_ops_job_run_job_name_ended_at
+  on public.ops_job_run (job_name, ended_at);
@@ -0,0 +1,207 @@
+-- =========================================================
+-- 005: range-partition fact_observation by observed_at (monthly)
+--
+-- Partitions are named fact_observation_pYYYYMM; a default partition
+-- catches rows outside the created range (e.g. a backfill into an
+-- archived month). Future months are pre-created and old months are
+-- detached/archived by:  python -m jobs.manage_partitions
+--
+-- Run in ONE transaction: the existing table is renamed, its rows copied
+-- into the partitioned table, dependent views re-pointed, and only then
+-- dropped.
+-- =========================================================
+
+create schema if not exists fact_archive;
+
+alter table public.fact_observation rename to fact_observation_unpartitioned;
+alter index if exists public.fact_observation_pkey rename to fact_observation_unpartitioned_pkey;
+
+create table public.fact_observation (
+  like public.fact_observation_unpartitioned including defaults including constraints,
+  primary key (station_id, metric_id, observed_at)
+) partition by range (observed_at);
+
+-- same foreign keys as before (dim_station, dim_metric, ops_job_run)
+do $$
+declare
+  c record;
+begin
+  for c in
+    select conname, pg_get_constraintdef(oid) as def
+    from pg_constraint
+    where conrelid = 'public.fact_observation_unpartitioned'::regclass
+      and contype = 'f'
+  loop
+    execute format('alter table public.fact_observation add constraint %I %s', c.conname, c.def);
+  end loop;
+end $$;
+
+-- newest-first lookups per station and platform-wide (one index probe
+-- per partition; bound observed_at so older months are pruned)
+create index if not exists ix_fact_observation_station_observed_at
+  on public.fact_observation (station_id, observed_at);
+
+create index if not exists ix_fact_observation_observed_at
+  on public.fact_observation (observed_at);
+
+-- monthly partitions from the oldest fact up to 3 months ahead
+do $$
+declare
+  m date;
+  last_month date := (date_trunc('month', now()) + interval '3 months')::date;
+begin
+  select coalesce(date_trunc('month', min(observed_at))::date, date_trunc('month', now())::date)
+    into m
+  from public.fact_observation_unpartitioned;
+
+  while m <= last_month loop
+    execute format(
+      'create table if not exists public.%I partition of public.fact_observation
+         for values from (%L) to (%L)',
+      'fact_observation_p' || to_char(m, 'YYYYMM'),
+      m::timestamptz,
+      (m + interval '1 month')::timestamptz
+    );
+    execute format(
+      'alter table public.%I enable row level security',
+      'fact_observation_p' || to_char(m, 'YYYYMM')
+    );
+    m := (m + interval '1 month')::date;
+  end loop;
+end $$;
+
+create table if not exists public.fact_observation_default
+  partition of public.fact_observation default;
+alter table public.fact_observation_default enable row level security;
+
+insert into public.fact_observation
+select * from public.fact_observation_unpartitioned;
+
+-- ---------------------------------------------------------
+-- RLS + grants (partitions have RLS on and no policies: only
+-- reachable through the parent)
+-- ---------------------------------------------------------
+alter table public.fact_observation enable row level security;
+
+create policy fact_observation_read
+  on public.fact_observation
+  for select
+  using (
+    exists (
+      select 1
+      from public.dim_station s
+      where s.station_id = fact_observation.station_id
+        and can_access_station(s.station_id, s.region)
+    )
+  );
+
+create policy fact_observation_write_ops
+  on public.fact_observation
+  for all
+  using (is_role('ops'))
+  with check (is_role('ops'));
+
+do $$
+declare
+  g record;
+begin
+  for g in
+    select grantee, privilege_type
+    from information_schema.role_table_grants
+    where table_schema = 'public'
+      and table_name = 'fact_observation_unpartitioned'
+  loop
+    execute format(
+      'grant %s on public.fact_observation to %s',
+      g.privilege_type,
+      case when g.grantee = 'PUBLIC' then 'public' else quote_ident(g.grantee) end
+    );
+  end loop;
+end $$;
+
+-- ---------------------------------------------------------
+-- Views: re-point to the partitioned table. The "latest observation"
+-- lookups become LIMIT 1 lateral scans (one index probe per partition,
+-- not an aggregate over all rows; 010 adds an observed_at bound so old
+-- months are pruned). View options (e.g. security_invoker) are kept.
+-- ---------------------------------------------------------
+create temp table _fact_view_options as
+select c.relname, c.reloptions
+from pg_class c
+join pg_namespace n on n.oid = c.relnamespace
+where n.nspname = 'public'
+  and c.relname in ('public_station_freshness', 'vw_platform_status')
+  and c.reloptions is not null;
+
+create or replace view public.public_station_freshness as
+select
+  s.station_id,
+  s.station_name,
+  l.last_observed_at,
+  now() - l.last_observed_at as staleness,
+  case
+    when l.last_observed_at is null then 'MISSING'::text
+    when now() - l.last_observed_at > interval '02:00:00' then 'STALE'::text
+    else 'FRESH'::text
+  end as freshness,
+  l.last_observed_at as last_seen
+from public.dim_station s
+left join lateral (
+  select f.observed_at as last_observed_at
+  from public.fact_observation f
+  where f.station_id = s.station_id
+  order by f.observed_at desc
+  limit 1
+) l on true
+where s.is_current = true
+  and s.is_smoketest = false;
+
+create or replace view public.vw_platform_status as
+with open_incidents as (
+  select count(*)::integer as open_incidents
+  from public.ops_incident
+  where ops_incident.status <> 'resolved'::text
+), freshness as (
+  -- max() over the partitioned table: one observed_at index probe per partition
+  select greatest(0::numeric, floor(extract(epoch from (now() - max(f.observed_at))) / 60::numeric))::integer
+           as worst_freshness_minutes
+  from public.fact_observation f
+), dq_issues as (
+  select count(*)::integer as bad_checks
+  from public.ops_dq_check_run
+  where ops_dq_check_run.status = any (array['warn'::text, 'fail'::text])
+    and ops_dq_check_run.evaluated_at >= now() - interval '24:00:00'
+), last_ingest as (
+  select max(ops_job_run.started_at) as last_ingest_at
+  from public.ops_job_run
+  where ops_job_run.job_name = 'ingest_openmeteo_all_stations'::text
+    and ops_job_run.status = 'succeeded'::text
+)
+select
+  case
+    when oi.open_incidents > 0 then 'RED'::text
+    when fr.worst_freshness_minutes > 120 or dq.bad_checks > 0 then 'AMBER'::text
+    else 'GREEN'::text
+  end as status,
+  fr.worst_freshness_minutes,
+  dq.bad_checks,
+  oi.open_incidents,
+  li.last_ingest_at as last_ingest,
+  now() as evaluated_at
+from open_incidents oi
+cross join freshness fr
+cross join dq_issues dq
+cross join last_ingest li;
+
+do $$
+declare
+  v record;
+begin
+  for v in select relname, reloptions from _fact_view_options loop
+    execute format('alter view public.%I set (%s)', v.relname, array_to_string(v.reloptions, ', '));
+  end loop;
+end $$;
+
+drop table _fact_view_options;
+
+drop table public.fact_observation_unpartitioned;
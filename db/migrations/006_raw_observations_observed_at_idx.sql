@@ -0,0 +1,9 @@
+-- =========================================================
+-- 006: raw_observations by observed_at
+-- python -m jobs.replay_fact selects raw rows per observed_at chunk;
+-- the unique key leads with source/station, so without this every
+-- chunk would scan the whole table
+-- =========================================================
+
+create index if not exists ix_raw_observations_observed_at
+  on public.raw_observations (observed_at);
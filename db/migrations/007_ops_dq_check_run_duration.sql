@@ -0,0 +1,10 @@
+-- =========================================================
+-- 007: per-check evaluation time on ops_dq_check_run
+-- jobs.run_dq runs checks in parallel with a per-check statement
+-- timeout; duration_ms shows which check is the expensive one.
+-- For a check evaluated for a batch of runs in one grouped query,
+-- every run of the batch carries that query's duration.
+-- =========================================================
+
+alter table public.ops_dq_check_run
+  add column if not exists duration_ms integer;
@@ -0,0 +1,74 @@
+-- =========================================================
+-- 008: per-run, per-metric statistics
+-- Filled while rows stream through the pipeline:
+--   stage 'raw'  — jobs.ingest, rows each run inserted/changed in raw
+--   stage 'fact' — jobs.transform_fact (and jobs.ingest --fused)
+-- DQ checks below read these few rows per run instead of rescanning
+-- raw_observations / fact_observation.
+-- mean = value_sum / (rows_total - value_nulls)
+-- stddev from value_sumsq the usual way
+-- =========================================================
+
+create table if not exists public.ops_run_metric_stats (
+  run_id       uuid        not null references public.ops_job_run (run_id),
+  stage        text        not null check (stage in ('raw', 'fact')),
+  metric_code  text        not null,
+  rows_total   bigint      not null default 0,
+  value_nulls  bigint      not null default 0,
+  value_min    numeric,
+  value_max    numeric,
+  value_sum    double precision not null default 0,
+  value_sumsq  double precision not null default 0,
+  below_min    bigint      not null default 0,
+  above_max    bigint      not null default 0,
+  late_rows    bigint      not null default 0,
+  updated_at   timestamptz not null default now(),
+  primary key (run_id, stage, metric_code)
+);
+
+alter table public.ops_run_metric_stats enable row level security;
+
+create policy ops_run_metric_stats_ops
+  on public.ops_run_metric_stats
+  for all
+  using (is_role('ops'))
+  with check (is_role('ops'));
+
+-- ---------------------------------------------------------
+-- DQ checks on the stats table (metric_value per ingest run)
+-- ---------------------------------------------------------
+insert into public.ops_dq_check_definition
+  (check_name, description, category, severity, target_table, target_grain,
+   threshold_value, threshold_operator, check_sql_template, is_active)
+values
+  (
+    'stats_fact_out_of_range_rate',
+    'Share of fact values outside dim_metric min_expected/max_expected (from ops_run_metric_stats)',
+    'validity', 'warning', 'ops_run_metric_stats', 'run',
+    0.01, '<=',
+    'select coalesce(sum(below_min + above_max)::numeric / nullif(sum(rows_total), 0), 0) as metric_value
+       from public.ops_run_metric_stats
+      where run_id = %(run_id)s and stage = ''fact''',
+    true
+  ),
+  (
+    'stats_raw_null_value_rate',
+    'Share of raw rows written by the run with no numeric value (from ops_run_metric_stats)',
+    'completeness', 'warning', 'ops_run_metric_stats', 'run',
+    0.05, '<=',
+    'select coalesce(sum(value_nulls)::numeric / nullif(sum(rows_total), 0), 0) as metric_value
+       from public.ops_run_metric_stats
+      where run_id = %(run_id)s and stage = ''raw''',
+    true
+  ),
+  (
+    'stats_fact_late_rate',
+    'Share of fact rows flagged is_late (from ops_run_metric_stats)',
+    'timeliness', 'warning', 'ops_run_metric_stats', 'run',
+    0.2, '<=',
+    'select coalesce(sum(late_rows)::numeric / nullif(sum(rows_total), 0), 0) as metric_value
+       from public.ops_run_metric_stats
+      where run_id = %(run_id)s and stage = ''fact''',
+    true
+  )
+on conflict (check_name) do nothing;
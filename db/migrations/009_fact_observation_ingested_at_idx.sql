@@ -0,0 +1,9 @@
+-- =========================================================
+-- 009: fact_observation by ingested_at
+-- The spike / drop detectors only re-check series with facts ingested
+-- since their last succeeded run (ops_anomaly_detector_run); this keeps
+-- that lookup to the new rows instead of a scan of every partition
+-- =========================================================
+
+create index if not exists ix_fact_observation_ingested_at
+  on public.fact_observation (ingested_at);
@@ -0,0 +1,61 @@
+-- =========================================================
+-- 010: public_station_freshness looks in recent partitions first
+--
+-- With fact_observation_default attached the partitions are not
+-- "ordered" for the planner, so the unbounded LIMIT 1 lookup from 005
+-- probes every monthly partition per station. The latest observation
+-- is now searched in the last 7 days first (observed_at bound = older
+-- months pruned); only stations with nothing that recent fall back to
+-- the unbounded lookup (MISSING / long-STALE stations keep their
+-- last_observed_at). View options (e.g. security_invoker) are kept.
+-- =========================================================
+
+create temp table _freshness_view_options as
+select c.reloptions
+from pg_class c
+join pg_namespace n on n.oid = c.relnamespace
+where n.nspname = 'public'
+  and c.relname = 'public_station_freshness'
+  and c.reloptions is not null;
+
+create or replace view public.public_station_freshness as
+select
+  s.station_id,
+  s.station_name,
+  l.last_observed_at,
+  now() - l.last_observed_at as staleness,
+  case
+    when l.last_observed_at is null then 'MISSING'::text
+    when now() - l.last_observed_at > interval '02:00:00' then 'STALE'::text
+    else 'FRESH'::text
+  end as freshness,
+  l.last_observed_at as last_seen
+from public.dim_station s
+cross join lateral (
+  select coalesce(
+    (
+      select max(f.observed_at)
+      from public.fact_observation f
+      where f.station_id = s.station_id
+        and f.observed_at >= now() - interval '7 days'
+    ),
+    (
+      select max(f.observed_at)
+      from public.fact_observation f
+      where f.station_id = s.station_id
+    )
+  ) as last_observed_at
+) l
+where s.is_current = true
+  and s.is_smoketest = false;
+
+do $$
+declare
+  v record;
+begin
+  for v in select reloptions from _freshness_view_options loop
+    execute format('alter view public.public_station_freshness set (%s)', array_to_string(v.reloptions, ', '));
+  end loop;
+end $$;
+
+drop table _freshness_view_options;
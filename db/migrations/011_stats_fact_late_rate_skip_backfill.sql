@@ -0,0 +1,18 @@
+-- =========================================================
+-- 011: stats_fact_late_rate ignores backfill runs
+-- Backfill (`jobs.ingest --backfill`) loads history by definition, so
+-- nearly all its fact rows are is_late and the 0.2 threshold from 008
+-- fired on every window. Backfill ingest runs carry
+-- run_stats.backfill = true; for those the check now sees no stats
+-- rows and reports 0.
+-- =========================================================
+
+update public.ops_dq_check_definition
+set check_sql_template =
+  'select coalesce(sum(s.late_rows)::numeric / nullif(sum(s.rows_total), 0), 0) as metric_value
+     from public.ops_run_metric_stats s
+     join public.ops_job_run r on r.run_id = s.run_id
+    where s.run_id = %(run_id)s and s.stage = ''fact''
+      and coalesce((r.run_stats->>''backfill'')::boolean, false) = false',
+    description = 'Share of fact rows flagged is_late (from ops_run_metric_stats; backfill runs excluded)'
+where check_name = 'stats_fact_late_rate';
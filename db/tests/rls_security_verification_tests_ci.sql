@@ -26,6 +26,27 @@ select set_config('request.jwt.claim.sub', '00000000-0000-0000-0000-000000000000
 select 'anon_no_fact_access' as check,
        case when (select count(*) from public.fact_observation) = 0 then 'PASS' else 'FAIL' end as result;
 
+-- partitions (monthly and default) have RLS on and no policies: reading
+-- them directly must not bypass the parent's policies
+select 'anon_no_fact_partition_access' as check,
+       case when exists (
+              select 1 from pg_inherits i
+              where i.inhparent = 'public.fact_observation'::regclass
+                and i.inhrelid <> 'public.fact_observation_default'::regclass
+            )
+             and (
+              select sum((xpath('/row/c/text()', query_to_xml(
+                       format('select count(*) as c from %s', i.inhrelid::regclass),
+                       false, true, '')))[1]::text::bigint)
+              from pg_inherits i
+              where i.inhparent = 'public.fact_observation'::regclass
+                and i.inhrelid <> 'public.fact_observation_default'::regclass
+            ) = 0
+            then 'PASS' else 'FAIL' end as result;
+
+select 'anon_no_fact_default_partition_access' as check,
+       case when (select count(*) from public.fact_observation_default) = 0 then 'PASS' else 'FAIL' end as result;
+
 -- ---------------------------------------------------------
 -- 2) ANON can read station metadata (must be > 0)
 -- ---------------------------------------------------------
@@ -92,6 +113,27 @@ select 'analyst_fact_scope_enforced' as check,
          then 'PASS' else 'FAIL'
        end as result;
 
+-- partitions (monthly and default) have RLS on and no policies: reading
+-- them directly must not bypass the parent's policies
+select 'analyst_no_fact_partition_access' as check,
+       case when exists (
+              select 1 from pg_inherits i
+              where i.inhparent = 'public.fact_observation'::regclass
+                and i.inhrelid <> 'public.fact_observation_default'::regclass
+            )
+             and (
+              select sum((xpath('/row/c/text()', query_to_xml(
+                       format('select count(*) as c from %s', i.inhrelid::regclass),
+                       false, true, '')))[1]::text::bigint)
+              from pg_inherits i
+              where i.inhparent = 'public.fact_observation'::regclass
+                and i.inhrelid <> 'public.fact_observation_default'::regclass
+            ) = 0
+            then 'PASS' else 'FAIL' end as result;
+
+select 'analyst_no_fact_default_partition_access' as check,
+       case when (select count(*) from public.fact_observation_default) = 0 then 'PASS' else 'FAIL' end as result;
+
 -- ---------------------------------------------------------
 -- 6) ANALYST cannot write reference data
 -- ---------------------------------------------------------
@@ -0,0 +1,55 @@
+# ============================================
+# jobs/anomaly_detectors/incremental.py
+# Series (station_id, metric_id) touched since a detector's last
+# succeeded run (ops_anomaly_detector_run), for detectors that only look
+# at the latest points of a series (spike, drop)
+# ============================================
+
+import os
+from datetime import timedelta
+
+# fact_observation.ingested_at is the raw row's ingest time, not when the
+# fact was written: a row ingested just before the last detector run but
+# transformed after it must still be picked up
+OVERLAP_MINUTES = int(os.environ.get("ANOMALY_OVERLAP_MINUTES", "360"))
+
+# uses ix_fact_observation_ingested_at (009); the change-aware fact
+# upsert only moves ingested_at when a value actually changed
+SQL_TOUCHED_SERIES = """
+  select distinct f.station_id, f.metric_id
+  from public.fact_observation f
+  where f.ingested_at > %(since)s
+"""
+
+# first run (or no succeeded run yet): every series
+SQL_ALL_SERIES = """
+  select s.station_id, m.metric_id
+  from public.dim_station s
+  cross join public.dim_metric m
+"""
+
+
+def last_succeeded_run_at(cur, detector_name: str):
+    """started_at of the detector's last succeeded run (RealDictCursor), or None."""
+    cur.execute(
+        """
+        select max(started_at) as started_at
+        from public.ops_anomaly_detector_run
+        where detector_name = %s
+          and status = 'succeeded'
+        """,
+        (detector_name,),
+    )
+    return cur.fetchone()["started_at"]
+
+
+def series_since_last_run(cur, detector_name: str) -> tuple[str, dict]:
+    """
+    (series SQL, params) for the series to re-check: those with facts
+    ingested since the last succeeded run minus OVERLAP_MINUTES, or all
+    of them when there is no such run.
+    """
+    last_run = last_succeeded_run_at(cur, detector_name)
+    if last_run is None:
+        return SQL_ALL_SERIES, {}
+    return SQL_TOUCHED_SERIES, {"since": last_run - timedelta(minutes=OVERLAP_MINUTES)}
@@ -5,14 +5,15 @@
 
 from psycopg2.extras import RealDictCursor
 
+# Only this far back is searched first: the observed_at bound lets the
+# planner prune fact_observation to the recent monthly partitions (there
+# is no ordered-partition shortcut while the default partition is
+# attached, so an unbounded lookup probes every month). Stations with
+# nothing that recent fall back to the unbounded lookup, which only runs
+# for them (coalesce evaluates it lazily).
+RECENT_LOOKBACK_DAYS = 7
+
 SQL_SILENT_STATION = """
-with last_seen as (
-  select
-    station_id,
-    max(observed_at) as last_observed_at
-  from public.fact_observation
-  group by station_id
-)
 select
   'silent_station'::text as anomaly_type,
   s.station_id,
@@ -27,8 +28,21 @@ select
       end
   ) as details
 from public.dim_station s
-left join last_seen l
-  on l.station_id = s.station_id
+cross join lateral (
+  select coalesce(
+    (
+      select max(f.observed_at)
+      from public.fact_observation f
+      where f.station_id = s.station_id
+        and f.observed_at >= now() - (interval '1 day' * %s)
+    ),
+    (
+      select max(f.observed_at)
+      from public.fact_observation f
+      where f.station_id = s.station_id
+    )
+  ) as last_observed_at
+) l
 where s.is_current = true
   and s.is_smoketest = false
   and (l.last_observed_at is null
@@ -41,5 +55,5 @@ def detect(conn) -> list[dict]:
     {anomaly_type, station_id, metric_id, severity, details}
     """
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(SQL_SILENT_STATION)
+        cur.execute(SQL_SILENT_STATION, (RECENT_LOOKBACK_DAYS,))
         return cur.fetchall()
@@ -6,6 +6,8 @@
 
 from psycopg2.extras import RealDictCursor, Json
 
+from jobs.anomaly_detectors.incremental import series_since_last_run
+
 # Hardcode thresholds per metric_code (edit these as you like)
 # Units match your fact_observation.value_num units for that metric.
 SPIKE_THRESHOLDS = {
@@ -20,30 +22,53 @@ SPIKE_THRESHOLDS = {
 # Only compare if the two latest points are within this window (prevents “spike” after long gaps)
 LOOKBACK_MINUTES = 180  # 3 hours
 
-SQL_SPIKE = """
-with ranked as (
+DETECTOR_NAME = "spike"  # as registered in jobs.run_anomaly_detection
+
+# Only series with facts ingested since this detector's last succeeded
+# run ({series}, see jobs.anomaly_detectors.incremental), and per series
+# only its latest two points: a LIMIT 2 lookup on the
+# (station_id, metric_id, observed_at) primary key, newest partition
+# first, instead of lag() / row_number() over all of history.
+SQL_SPIKE_TEMPLATE = """
+with series as ({series}),
+latest as (
   select
-    f.station_id,
-    f.metric_id,
+    se.station_id,
+    se.metric_id,
     m.metric_code,
-    f.observed_at,
-    f.value_num,
-    lag(f.value_num) over (partition by f.station_id, f.metric_id order by f.observed_at) as prev_value,
-    lag(f.observed_at) over (partition by f.station_id, f.metric_id order by f.observed_at) as prev_observed_at
-  from public.fact_observation f
+    p.observed_at,
+    p.value_num,
+    p.prev_value,
+    p.prev_observed_at
+  from series se
+  join public.dim_station s
+    on s.station_id = se.station_id
   join public.dim_metric m
-    on m.metric_id = f.metric_id
-),
-latest as (
-  select
-    r.*,
-    row_number() over (partition by station_id, metric_id order by observed_at desc) as rn
-  from ranked r
-  where prev_value is not null
+    on m.metric_id = se.metric_id
+  cross join lateral (
+    select
+      x.observed_at,
+      x.value_num,
+      lead(x.value_num) over (order by x.observed_at desc) as prev_value,
+      lead(x.observed_at) over (order by x.observed_at desc) as prev_observed_at
+    from (
+      select f.observed_at, f.value_num
+      from public.fact_observation f
+      where f.station_id = se.station_id
+        and f.metric_id = se.metric_id
+      order by f.observed_at desc
+      limit 2
+    ) x
+    order by x.observed_at desc
+    limit 1
+  ) p
+  where s.is_current = true
+    and s.is_smoketest = false
+    and %(thresholds)s::jsonb ? m.metric_code
 )
 select
   'spike'::text as anomaly_type,
-  s.station_id,
+  l.station_id,
   l.metric_id,
   'medium'::text as severity,
   jsonb_build_object(
@@ -54,28 +79,23 @@ select
     'prev_value', l.prev_value,
     'delta', (l.value_num - l.prev_value),
     'threshold', (cfg.cfg ->> l.metric_code)::numeric,
-    'lookback_minutes', %s
+    'lookback_minutes', %(lookback_minutes)s
   ) as details
 from latest l
-join public.dim_station s
-  on s.station_id = l.station_id
-cross join (select %s::jsonb as cfg) cfg
-where l.rn = 1
-  and s.is_current = true
-  and s.is_smoketest = false
-  and l.prev_observed_at >= l.observed_at - (interval '1 minute' * %s)
-  and (cfg.cfg ? l.metric_code)
+cross join (select %(thresholds)s::jsonb as cfg) cfg
+where l.prev_observed_at >= l.observed_at - (interval '1 minute' * %(lookback_minutes)s)
   and (l.value_num - l.prev_value) > (cfg.cfg ->> l.metric_code)::numeric;
 """
 
 def detect(conn) -> list[dict]:
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        series_sql, params = series_since_last_run(cur, DETECTOR_NAME)
         cur.execute(
-            SQL_SPIKE,
-            (
-                LOOKBACK_MINUTES,
-                Json(SPIKE_THRESHOLDS),
-                LOOKBACK_MINUTES,
-            ),
+            SQL_SPIKE_TEMPLATE.format(series=series_sql),
+            {
+                **params,
+                "thresholds": Json(SPIKE_THRESHOLDS),
+                "lookback_minutes": LOOKBACK_MINUTES,
+            },
         )
         return cur.fetchall()
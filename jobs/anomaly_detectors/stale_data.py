@@ -7,18 +7,45 @@ from psycopg2.extras import RealDictCursor
 
 STALE_MINUTES = 120  # change later if you want (2 hours)
 
+# Latest point per series, searched in the last RECENT_LOOKBACK_DAYS
+# first: the observed_at bound lets the planner prune fact_observation to
+# the recent monthly partitions (with the default partition attached an
+# unbounded lookup probes every month). Series with nothing that recent
+# fall back to the unbounded lookup, evaluated only for them; series
+# that never reported stay null and are not flagged, same as before.
+RECENT_LOOKBACK_DAYS = 7
+
 SQL_STALE_DATA = """
 with last_seen as (
   select
-    station_id,
-    metric_id,
-    max(observed_at) as last_observed_at
-  from public.fact_observation
-  group by station_id, metric_id
+    s.station_id,
+    m.metric_id,
+    l.last_observed_at
+  from public.dim_station s
+  cross join public.dim_metric m
+  cross join lateral (
+    select coalesce(
+      (
+        select max(f.observed_at)
+        from public.fact_observation f
+        where f.station_id = s.station_id
+          and f.metric_id = m.metric_id
+          and f.observed_at >= now() - (interval '1 day' * %s)
+      ),
+      (
+        select max(f.observed_at)
+        from public.fact_observation f
+        where f.station_id = s.station_id
+          and f.metric_id = m.metric_id
+      )
+    ) as last_observed_at
+  ) l
+  where s.is_current = true
+    and s.is_smoketest = false
 )
 select
   'stale_data'::text as anomaly_type,
-  s.station_id,
+  l.station_id,
   l.metric_id,
   'medium'::text as severity,
   jsonb_build_object(
@@ -27,11 +54,7 @@ select
     'stale_threshold_minutes', %s
   ) as details
 from last_seen l
-join public.dim_station s
-  on s.station_id = l.station_id
-where s.is_current = true
-  and s.is_smoketest = false
-  and l.last_observed_at < now() - (interval '1 minute' * %s);
+where l.last_observed_at < now() - (interval '1 minute' * %s);
 """
 
 def detect(conn) -> list[dict]:
@@ -40,5 +63,5 @@ def detect(conn) -> list[dict]:
     {anomaly_type, station_id, metric_id, severity, details}
     """
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(SQL_STALE_DATA, (STALE_MINUTES, STALE_MINUTES))
+        cur.execute(SQL_STALE_DATA, (RECENT_LOOKBACK_DAYS, STALE_MINUTES, STALE_MINUTES))
         return cur.fetchall()
@@ -0,0 +1,105 @@
+# ============================================
+# jobs/dim_cache.py
+# In-process surrogate key cache for dim_station / dim_metric
+# ============================================
+
+import threading
+import time
+
+SQL_DIM_VERSION = """
+  select
+    (select count(*) from public.dim_station where is_current = true),
+    (select max(station_id) from public.dim_station),
+    (select max(valid_from) from public.dim_station),
+    (select md5(coalesce(string_agg(
+        concat_ws(':', metric_id, metric_code, min_expected, max_expected),
+        ',' order by metric_id), ''))
+       from public.dim_metric)
+"""
+
+SQL_LOAD_STATIONS = """
+  select station_external_id, station_id
+  from public.dim_station
+  where is_current = true
+"""
+
+SQL_LOAD_METRICS = """
+  select metric_code, metric_id, min_expected, max_expected
+  from public.dim_metric
+"""
+
+
+class DimensionCache:
+    """
+    Current surrogate keys, loaded once and shared by every batch of a job:
+
+    - station_external_id -> station_id (current SCD version only)
+    - metric_code -> metric_id, plus (min_expected, max_expected)
+
+    The cache is tied to a cheap version fingerprint of both tables (current
+    station count, max station_id / valid_from, hash of dim_metric). ensure()
+    re-reads the fingerprint at most every `check_seconds` and reloads only
+    when it changed, so a new station version or metric is picked up mid-run
+    without a join per statement.
+
+    Lookups take whole columns (a list of codes) and return a list of keys,
+    None where a code is unknown.
+    """
+
+    def __init__(self, check_seconds: float = 60.0):
+        self.check_seconds = check_seconds
+        self.version = None
+        self.loads = 0
+        self._checked_at = 0.0
+        self._stations: dict[str, int] = {}
+        self._metrics: dict[str, int] = {}
+        self._bounds: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None
+
+    def ensure(self, cur, force: bool = False) -> bool:
+        """Load or reload if the dimensions changed. Returns True when it (re)loaded."""
+        with self._lock:
+            now = time.monotonic()
+            if self.loaded and not force and now - self._checked_at < self.check_seconds:
+                return False
+
+            cur.execute(SQL_DIM_VERSION)
+            version = tuple(cur.fetchone())
+            self._checked_at = now
+            if version == self.version and not force:
+                return False
+
+            cur.execute(SQL_LOAD_STATIONS)
+            stations = {str(sid): station_id for sid, station_id in cur.fetchall()}
+            cur.execute(SQL_LOAD_METRICS)
+            metrics, bounds = {}, {}
+            for code, metric_id, lo, hi in cur.fetchall():
+                metrics[code] = metric_id
+                bounds[code] = (
+                    float(lo) if lo is not None else None,
+                    float(hi) if hi is not None else None,
+                )
+
+            # swap whole dicts: readers never see a half-loaded cache
+            self._stations, self._metrics, self._bounds = stations, metrics, bounds
+            self.version = version
+            self.loads += 1
+            return True
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.version = None
+
+    def station_ids(self, station_external_ids: list) -> list:
+        return list(map(self._stations.get, station_external_ids))
+
+    def metric_ids(self, metric_codes: list) -> list:
+        return list(map(self._metrics.get, metric_codes))
+
+    def metric_bounds(self, metric_codes: list) -> list:
+        """(min_expected, max_expected) per code; (None, None) for unknown or unbounded."""
+        return [self._bounds.get(code, (None, None)) for code in metric_codes]
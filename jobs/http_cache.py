@@ -0,0 +1,136 @@
+# ============================================
+# jobs/http_cache.py
+# On-disk JSON response cache for provider fetches
+# (TTL + size-bounded LRU eviction, offline replay)
+# ============================================
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class OfflineMiss(LookupError):
+    """Offline mode and the request is not in the cache."""
+
+
+class ResponseCache:
+    """
+    One JSON file per request under `directory`, named by a hash of the
+    normalized request (url + sorted params + scope, e.g. the target hour).
+
+    - TTL: an entry older than `ttl_seconds` (by the time it was stored) is
+      a miss and gets re-fetched
+    - LRU: a hit touches the file mtime; when the directory grows past
+      `max_bytes` the least recently used files are removed
+    - offline: never expire, never fetch; a miss raises OfflineMiss, so
+      recorded payloads can be replayed without network
+    """
+
+    def __init__(self, directory: str, ttl_seconds: float = 3600,
+                 max_bytes: int = 256 * 1024 * 1024, offline: bool = False,
+                 scope: str = None):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.scope = scope
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def key(self, url: str, params: dict) -> str:
+        normalized = {
+            "url": url,
+            "params": sorted((str(k), str(v)) for k, v in params.items()),
+            "scope": self.scope,
+        }
+        raw = json.dumps(normalized, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, url: str, params: dict):
+        path = self._path(self.key(url, params))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        fresh = entry is not None and (
+            self.offline or time.time() - entry.get("stored_at", 0) <= self.ttl_seconds
+        )
+
+        with self._lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if not fresh:
+            if self.offline:
+                raise OfflineMiss(f"not cached (offline): {url} {params}")
+            return None
+
+        try:
+            os.utime(path)  # LRU recency
+        except OSError:
+            pass
+        return entry["payload"]
+
+    def put(self, url: str, params: dict, payload) -> None:
+        if self.offline:
+            return
+
+        path = self._path(self.key(url, params))
+        body = json.dumps({"stored_at": time.time(), "url": url, "payload": payload})
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._size += len(body)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def take_stats(self) -> dict:
+        """Hit/miss counts since the last call (per job run)."""
+        with self._lock:
+            stats = {"cache_hits": self.hits, "cache_misses": self.misses}
+            self.hits = self.misses = 0
+        return stats
+
+    def _entries(self):
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield path, st.st_mtime, st.st_size
+
+    def _evict(self) -> None:
+        # caller holds the lock; drop least recently used until under 90% of the budget
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
@@ -1,17 +1,81 @@
-import os, sys, traceback
-from datetime import datetime, timezone
+import os, sys, traceback, queue, threading, zlib
+import json
+from itertools import compress, repeat
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 import requests
 import psycopg2
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 from dotenv import load_dotenv
 
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from jobs.dim_cache import DimensionCache
+from jobs.http_cache import OfflineMiss, ResponseCache
+from jobs.metric_stats import MetricStats
+from jobs.validation import validate_column, validate_rows
+from jobs.rate_limit import AdaptiveLimiter, CircuitBreaker, CircuitOpen, PerHostRateLimiter
+
 load_dotenv()
 
 DATABASE_URL = os.environ["OBS_DATABASE_URL"]
 OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+OPEN_METEO_ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+
+INGEST_JOB_NAME = "ingest_openmeteo_all_stations"
+TRANSFORM_JOB_NAME = "transform_raw_to_fact"
+
+# Locations per Open-Meteo request (comma-separated lat/lon lists).
+# Override with INGEST_BATCH_SIZE or --batch-size N; 1 = one request per station.
+FETCH_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "50"))
+
+# Coalesce stations sharing a forecast grid cell into one fetch location.
+# Cell size in degrees (INGEST_GRID_RESOLUTION / --grid-resolution D); 0 = off.
+GRID_RESOLUTION = float(os.environ.get("INGEST_GRID_RESOLUTION", "0"))
+
+# Chunk requests in flight at once (INGEST_CONCURRENCY / --concurrency N)
+# and requests per second per host (INGEST_RATE_LIMIT / --rate-limit R, 0 = unlimited).
+FETCH_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "4"))
+FETCH_RATE_LIMIT = float(os.environ.get("INGEST_RATE_LIMIT", "5"))
+
+# Provider health (429/5xx) is handled run-wide, not per request:
+# attempts per request, consecutive failures that open the circuit breaker
+# (0 = never) and seconds before an open breaker lets a probe through.
+FETCH_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", "4"))
+BREAKER_THRESHOLD = int(os.environ.get("INGEST_BREAKER_THRESHOLD", "10"))
+BREAKER_COOLDOWN = float(os.environ.get("INGEST_BREAKER_COOLDOWN", "60"))
+THROTTLE_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+# --pipeline mode: fetched chunks waiting for the writer (backpressure bound)
+# and rows buffered before each DB flush.
+PIPELINE_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "8"))
+PIPELINE_FLUSH_ROWS = int(os.environ.get("INGEST_FLUSH_ROWS", "2000"))
+
+# Optional on-disk response cache (INGEST_CACHE_DIR / --cache-dir; unset = off).
+# Entries live INGEST_CACHE_TTL seconds, the directory is kept under
+# INGEST_CACHE_MAX_MB; --offline / INGEST_CACHE_OFFLINE=1 replays from it only.
+# Hourly entries are scoped to the run's target hour, so replaying a recorded
+# run later needs --target-hour YYYY-MM-DDTHH:00 (UTC) of the recording.
+CACHE_DIR = os.environ.get("INGEST_CACHE_DIR", "")
+CACHE_TTL_SECONDS = float(os.environ.get("INGEST_CACHE_TTL", "3600"))
+CACHE_MAX_MB = float(os.environ.get("INGEST_CACHE_MAX_MB", "256"))
+CACHE_OFFLINE = os.environ.get("INGEST_CACHE_OFFLINE", "") == "1"
+
+# Compact raw storage (INGEST_COMPACT_PAYLOAD=1 / --compact-payload): the
+# context shared by all metrics of a station-hour is stored once in
+# raw_observation_context and each row keeps only its metric slice.
+COMPACT_PAYLOAD = os.environ.get("INGEST_COMPACT_PAYLOAD", "") == "1"
+CONTEXT_KEY = ("source", "station_external_id", "observed_at")
+PAYLOAD_CONTEXT_KEYS = ("provider", "station_external_id", "latitude", "longitude", "observed_at")
+
+# checkpoints of a run still 'started' are only adopted once the run is
+# this old (taken as crashed); younger ones may be a live overlapping run
+ADOPT_STALE_MINUTES = int(os.environ.get("INGEST_ADOPT_STALE_MINUTES", "120"))
+
+# --backfill FROM TO: days per archive request (and per ingest run)
+BACKFILL_CHUNK_DAYS = int(os.environ.get("INGEST_BACKFILL_CHUNK_DAYS", "31"))
 
 METRICS = {
     "temperature_2m":          ("temperature_2m",        "degrees Celsius",     "num"),
@@ -24,36 +88,49 @@ METRICS = {
     "weather_code":            ("weather_code",          "dimensionless code",  "num"),
 }
 
-def _build_retrying_session() -> requests.Session:
+def _build_retrying_session(pool_size: int = 10) -> requests.Session:
     """
     GitHub runners sometimes hit transient TLS/handshake/read timeouts.
     Use retries + backoff so the workflow doesn't die randomly.
+
+    Only transport errors are retried here. 429/5xx come straight back to
+    _http_get, which throttles the whole run (AdaptiveLimiter) and feeds the
+    circuit breaker instead of sleeping per request.
     """
     retry = Retry(
-        total=6,
-        connect=6,
-        read=6,
-        status=6,
-        backoff_factor=1.5,                   # 0s, 1.5s, 3s, 6s, 12s, ...
-        status_forcelist=(429, 500, 502, 503, 504),
+        total=3,
+        connect=3,
+        read=3,
+        status=0,
+        backoff_factor=1.5,                   # 0s, 1.5s, 3s
+        status_forcelist=(),
         allowed_methods=frozenset(["GET"]),
         raise_on_status=False,
-        respect_retry_after_header=True,
     )
-    adapter = HTTPAdapter(max_retries=retry, pool_connections=10, pool_maxsize=10)
+    # pool_maxsize must cover the fetch concurrency, otherwise worker threads
+    # open throwaway connections (and TLS handshakes) the pool then discards
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=10, pool_maxsize=pool_size)
     s = requests.Session()
     s.mount("https://", adapter)
     s.mount("http://", adapter)
     return s
 
-SESSION = _build_retrying_session()
+SESSION = _build_retrying_session(max(10, FETCH_CONCURRENCY))
+RATE_LIMITER = PerHostRateLimiter(FETCH_RATE_LIMIT)
+LIMITER = AdaptiveLimiter(FETCH_CONCURRENCY)
+BREAKER = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+RESPONSE_CACHE: ResponseCache = None
+# station/metric surrogate keys (--fused) and metric bounds (run stats),
+# re-validated at most every INGEST_DIM_CHECK_SECONDS against the
+# dimension version fingerprint
+DIM_CACHE = DimensionCache(float(os.environ.get("INGEST_DIM_CHECK_SECONDS", "60")))
 
-def start_job(cur, job_name: str) -> str:
+def start_job(cur, job_name: str, parent_run_id: str = None) -> str:
     cur.execute("""
-      insert into public.ops_job_run (job_name, status, started_at)
-      values (%s, 'started', now())
+      insert into public.ops_job_run (job_name, status, started_at, parent_run_id)
+      values (%s, 'started', now(), %s)
       returning run_id
-    """, (job_name,))
+    """, (job_name, parent_run_id))
     return cur.fetchone()[0]
 
 def finish_job(cur, run_id: str, status: str, error_message: str = None,
@@ -69,58 +146,293 @@ def finish_job(cur, run_id: str, status: str, error_message: str = None,
       where run_id = %s
     """, (status, error_message, rows_inserted, rows_updated, rows_deduped, run_id))
 
-def fetch_open_meteo(lat: float, lon: float) -> dict:
-    params = {
-        "latitude": lat,
-        "longitude": lon,
+def set_watermarks(cur, run_id: str, watermark_from: datetime, watermark_to: datetime):
+    cur.execute("""
+      update public.ops_job_run
+      set watermark_from = %s,
+          watermark_to   = %s
+      where run_id = %s
+    """, (watermark_from, watermark_to, run_id))
+
+def fetch_stats() -> dict:
+    """Counters collected since the previous call: throttling, breaker, cache."""
+    stats = {**LIMITER.take_stats(), **BREAKER.take_stats()}
+    if RESPONSE_CACHE is not None:
+        stats.update(RESPONSE_CACHE.take_stats())
+    return stats
+
+def record_run_stats(cur, run_id: str, stats: dict):
+    """Merge counters into ops_job_run.run_stats (jsonb)."""
+    if not stats:
+        return
+    cur.execute("""
+      update public.ops_job_run
+      set run_stats = coalesce(run_stats, '{}'::jsonb) || %s
+      where run_id = %s
+    """, (Json(stats), run_id))
+
+# the target hour is the next full hour: from 23:00 UTC on that is
+# tomorrow's 00:00, which a one-day forecast does not contain
+def _forecast_params(latitude, longitude) -> dict:
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
         "hourly": ",".join(v[0] for v in METRICS.values()),
         "timezone": "UTC",
         "past_days": 0,
-        "forecast_days": 1,
+        "forecast_days": 2,
     }
 
-    # More robust in CI: separate connect/read timeouts
-    # connect timeout: 15s (TLS handshake etc)
-    # read timeout: 90s (slow API response)
-    r = SESSION.get(OPEN_METEO_URL, params=params, timeout=(15, 90))
-    r.raise_for_status()
-    return r.json()
+def _archive_params(latitude, longitude, window: tuple[date, date]) -> dict:
+    start_date, end_date = window
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "hourly": ",".join(v[0] for v in METRICS.values()),
+        "timezone": "UTC",
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+    }
 
-def pick_hour_index(data: dict) -> int:
-    hourly = data.get("hourly", {})
-    times = hourly.get("time", [])
-    if not times:
-        return -1
+def _retry_after_seconds(r: requests.Response, attempt: int) -> float:
+    value = r.headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(value)
+                return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return 1.5 * (2 ** (attempt - 1))  # same curve as the transport retries
+
+class ProviderThrottled(requests.HTTPError):
+    """429/5xx still coming back after FETCH_MAX_ATTEMPTS (provider overloaded, not a bad chunk)."""
+
+def _http_get(url: str, params: dict) -> requests.Response:
+    """
+    One provider GET under the run-wide controls:
+    circuit breaker -> adaptive concurrency slot -> per-host rate limit.
+
+    A 429/5xx halves the shared concurrency limit, pauses every thread for
+    Retry-After (or a backoff) and counts towards the breaker; the request
+    is retried up to FETCH_MAX_ATTEMPTS. Once the breaker is open the rest
+    of the run gets CircuitOpen immediately instead of waiting out retries.
+    A throttle status on the last attempt raises ProviderThrottled.
+    """
+    for attempt in range(1, FETCH_MAX_ATTEMPTS + 1):
+        BREAKER.check()
+
+        LIMITER.acquire()
+        try:
+            RATE_LIMITER.acquire(url)
+            # More robust in CI: separate connect/read timeouts
+            # connect timeout: 15s (TLS handshake etc)
+            # read timeout: 90s (slow API response)
+            r = SESSION.get(url, params=params, timeout=(15, 90))
+        except requests.RequestException:
+            BREAKER.record_failure()
+            raise
+        finally:
+            LIMITER.release()
+
+        if r.status_code in THROTTLE_STATUSES:
+            BREAKER.record_failure()
+            LIMITER.on_throttle(_retry_after_seconds(r, attempt))
+            if attempt < FETCH_MAX_ATTEMPTS:
+                continue
+            raise ProviderThrottled(
+                f"{r.status_code} from {url} after {FETCH_MAX_ATTEMPTS} attempts", response=r,
+            )
+        else:
+            BREAKER.record_success()
+            LIMITER.on_success()
+
+        r.raise_for_status()
+        return r
+
+def _get_json(url: str, params: dict):
+    """GET + JSON decode, served from RESPONSE_CACHE when one is configured."""
+    if RESPONSE_CACHE is not None:
+        cached = RESPONSE_CACHE.get(url, params)
+        if cached is not None:
+            return cached
+
+    payload = _http_get(url, params).json()
+
+    if RESPONSE_CACHE is not None:
+        RESPONSE_CACHE.put(url, params, payload)
+    return payload
+
+def fetch_open_meteo(lat: float, lon: float) -> dict:
+    return _get_json(OPEN_METEO_URL, _forecast_params(lat, lon))
+
+def fetch_open_meteo_batch(coords: list[tuple[float, float]], window: tuple[date, date] = None) -> list[dict]:
+    """
+    One request for many locations.
+    Open-Meteo accepts comma-separated latitude/longitude lists and answers
+    with a JSON list in the same order (a plain object for a single location).
+
+    window=(start_date, end_date) asks the historical archive API for the
+    whole date range instead of the current forecast day (backfill).
+    """
+    lats = ",".join(str(lat) for lat, _ in coords)
+    lons = ",".join(str(lon) for _, lon in coords)
+    if window is None:
+        url, params = OPEN_METEO_URL, _forecast_params(lats, lons)
+    else:
+        url, params = OPEN_METEO_ARCHIVE_URL, _archive_params(lats, lons, window)
+
+    payload = _get_json(url, params)
+    if isinstance(payload, dict):
+        payload = [payload]
+    if len(payload) != len(coords):
+        raise ValueError(
+            f"Open-Meteo returned {len(payload)} locations for {len(coords)} requested"
+        )
+    return payload
+
+def fetch_stations_chunk(chunk: list[tuple], window: tuple[date, date] = None,
+                         failures: list = None) -> list[tuple[str, dict]]:
+    """
+    Fetch a chunk of fetch units (station_external_ids, lat, lon) in one
+    request and fan the response back out to every station of each unit
+    (see plan_fetch_units).
+
+    If the chunk request fails (bad coordinate, truncated/mismatched
+    response, transport retries exhausted) the chunk is halved and each half
+    retried, so one bad location costs a few extra requests instead of the
+    whole chunk. An open breaker or a provider still throttling after its
+    attempts defers the chunk as a whole instead.
+    A single unit that still fails raises, like the unbatched path did,
+    unless a `failures` list is given: then (station_external_id, error) is
+    appended there for each of its stations and the rest of the run carries on.
+    """
+    try:
+        payload = fetch_open_meteo_batch(
+            [(float(lat), float(lon)) for _, lat, lon in chunk], window
+        )
+    except (CircuitOpen, ProviderThrottled) as e:
+        # provider is down or throttling: defer the whole chunk (bisecting
+        # would only send it more requests), a later run picks it up
+        if failures is None:
+            raise
+        failures.extend((sid, f"deferred: {e}") for station_ids, _, _ in chunk for sid in station_ids)
+        return []
+    except (requests.RequestException, ValueError, OfflineMiss) as e:
+        if len(chunk) == 1:
+            if failures is None:
+                raise
+            failures.extend((sid, f"{type(e).__name__}: {e}") for sid in chunk[0][0])
+            return []
+        mid = len(chunk) // 2
+        return (fetch_stations_chunk(chunk[:mid], window, failures)
+                + fetch_stations_chunk(chunk[mid:], window, failures))
+
+    return [
+        (station_external_id, data)
+        for (station_ids, _, _), data in zip(chunk, payload)
+        for station_external_id in station_ids
+    ]
+
+def plan_fetch_units(stations: list[tuple], resolution: float = 0.0) -> list[tuple]:
+    """
+    Turn (station_external_id, lat, lon) rows into fetch units
+    (station_external_ids, lat, lon).
+
+    resolution <= 0: one unit per station (exact coordinates).
+    resolution > 0 (degrees): stations are grouped by grid cell
+    (lat/lon snapped to multiples of `resolution`) and each cell is fetched
+    once at its centre. Stations a few hundred metres apart land in the same
+    forecast model cell anyway, so they get identical data; request volume
+    then follows geographic coverage instead of station count.
+    """
+    if resolution <= 0:
+        return [((str(sid),), lat, lon) for sid, lat, lon in stations]
+
+    cells: dict[tuple[int, int], list[str]] = {}
+    for sid, lat, lon in stations:
+        key = (round(float(lat) / resolution), round(float(lon) / resolution))
+        cells.setdefault(key, []).append(str(sid))
+
+    return [
+        (tuple(sids), round(i * resolution, 6), round(j * resolution, 6))
+        for (i, j), sids in cells.items()
+    ]
 
-    now = datetime.now(timezone.utc)
+def chunked(items: list, size: int) -> list[list]:
+    size = max(1, size)
+    return [items[i:i + size] for i in range(0, len(items), size)]
 
+def iter_fetched_chunks(chunks: list[list], concurrency: int, window: tuple[date, date] = None,
+                        failures: list = None):
+    """
+    Fetch chunks on a bounded thread pool and yield each chunk's
+    [(station_external_id, data), ...] as soon as it completes.
+
+    At most `concurrency` chunks are in flight, so a slow station only holds
+    its own worker while the others keep going. Results come back on the
+    calling thread, which owns the DB connection. The first fetch error is
+    re-raised after the not-yet-started chunks are cancelled (see
+    fetch_stations_chunk for collecting per-station failures instead).
+    """
+    concurrency = max(1, concurrency)
+    pending_chunks = iter(chunks)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fetch") as pool:
+        in_flight = set()
+        try:
+            for chunk in pending_chunks:
+                in_flight.add(pool.submit(fetch_stations_chunk, chunk, window, failures))
+                if len(in_flight) >= concurrency:
+                    break
+
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+                    next_chunk = next(pending_chunks, None)
+                    if next_chunk is not None:
+                        in_flight.add(pool.submit(fetch_stations_chunk, next_chunk, window, failures))
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+class MissingTargetHour(ValueError):
+    """The payload's hourly axis has no slot for the target hour."""
+
+def pick_hour_index(data: dict, target_hour: datetime) -> int:
+    """Index of exactly `target_hour` in the payload's hourly axis, or -1."""
+    times = data.get("hourly", {}).get("time", [])
     for i, t in enumerate(times):
-        dt = datetime.fromisoformat(t).replace(tzinfo=timezone.utc)
-        if dt >= now:
+        if datetime.fromisoformat(t).replace(tzinfo=timezone.utc) == target_hour:
             return i
+    return -1
 
-    return len(times) - 1  # fallback
-
-def build_rows_from_open_meteo(station_external_id: str, data: dict) -> list[dict]:
+def build_rows_from_open_meteo(station_external_id: str, data: dict,
+                               target_hour: datetime = None) -> list[dict]:
     """
     Store a *payload slice per row*:
     - Each row gets only what is relevant for that metric at that observed_at
     - No full API response, no full hourly series
+
+    Rows are for exactly `target_hour` (default: target_hour_for(now));
+    a payload without that slot raises MissingTargetHour rather than
+    storing a neighbouring hour under the wrong observed_at.
     """
     rows = []
     hourly = data.get("hourly", {})
     times = hourly.get("time", [])
-    if not times:
-        return rows
 
-    i = pick_hour_index(data)
+    target_hour = target_hour or target_hour_for(datetime.now(timezone.utc))
+    i = pick_hour_index(data, target_hour)
     if i < 0:
-        return rows
+        raise MissingTargetHour(f"payload has no {target_hour:%Y-%m-%dT%H:%M} slot")
 
     chosen_time = times[i]
     observed_at = datetime.fromisoformat(chosen_time).replace(tzinfo=timezone.utc)
 
-    provider = "OpenMeteo"
     lat = data.get("latitude")
     lon = data.get("longitude")
     hourly_units = data.get("hourly_units", {}) or {}
@@ -134,63 +446,200 @@ def build_rows_from_open_meteo(station_external_id: str, data: dict) -> list[dic
         if v is None:
             continue
 
-        source_payload = {
-            "provider": provider,
-            "station_external_id": str(station_external_id),
-            "latitude": lat,
-            "longitude": lon,
-            "observed_at": chosen_time,
-            "field": field,
-            "metric_code": metric_code,
-            "unit": hourly_units.get(field, unit) or unit,
-            "value": v,
-        }
+        rows.append(_make_raw_row(
+            station_external_id, lat, lon, chosen_time, observed_at,
+            metric_code, field, unit, hourly_units.get(field, unit) or unit, kind, v,
+        ))
 
-        row = {
-            "source": provider,
-            "station_external_id": str(station_external_id),
-            "observed_at": observed_at,
-            "metric_code": metric_code,
-            "unit": unit,
-            "quality_flag": None,
-            "source_payload": source_payload,
-        }
+    return rows
+
+def _make_raw_row(station_external_id, lat, lon, time_text: str, observed_at: datetime,
+                  metric_code: str, field: str, unit: str, source_unit: str, kind: str, v) -> dict:
+    provider = "OpenMeteo"
+
+    source_payload = {
+        "provider": provider,
+        "station_external_id": str(station_external_id),
+        "latitude": lat,
+        "longitude": lon,
+        "observed_at": time_text,
+        "field": field,
+        "metric_code": metric_code,
+        "unit": source_unit,
+        "value": v,
+    }
+
+    row = {
+        "source": provider,
+        "station_external_id": str(station_external_id),
+        "observed_at": observed_at,
+        "metric_code": metric_code,
+        "unit": unit,
+        "quality_flag": None,
+        "source_payload": source_payload,
+    }
+
+    if kind == "num":
+        row["value_num"] = float(v)
+        row["value_text"] = None
+    else:
+        row["value_num"] = None
+        row["value_text"] = str(v)
+
+    return row
+
+def decode_time_axis(times: list[str]) -> list[datetime]:
+    """
+    Parse a whole hourly time column at once.
+    Open-Meteo's axis is contiguous hourly, so only the first stamp is
+    parsed and the rest are derived by offset; the derived stamps are
+    formatted back and compared with the column as a whole (catches gaps,
+    duplicates and reordering), and any mismatch falls back to parsing
+    every element.
+    """
+    if not times:
+        return []
+
+    first = datetime.fromisoformat(times[0])
+    hour = timedelta(hours=1)
+    derived = [first + hour * i for i in range(len(times))]
+    if [d.isoformat(timespec="minutes") for d in derived] == times:
+        return [d.replace(tzinfo=timezone.utc) for d in derived]
+
+    return [datetime.fromisoformat(t).replace(tzinfo=timezone.utc) for t in times]
 
-        if kind == "num":
-            row["value_num"] = float(v)
-            row["value_text"] = None
+class StationColumns:
+    """
+    Backfill rows of one station, column by column: one block per metric,
+    (metric_code, field, unit, source_unit, kind, times, observed, values)
+    with nulls already dropped. RawWriter writes these without building a
+    row dict or payload dict per value (source_payload is assembled by the
+    INSERT from one shared per-block part plus the value).
+    """
+
+    __slots__ = ("station_external_id", "latitude", "longitude", "blocks", "rows")
+
+    def __init__(self, station_external_id: str, latitude, longitude, blocks: list[tuple]):
+        self.station_external_id = str(station_external_id)
+        self.latitude = latitude
+        self.longitude = longitude
+        self.blocks = blocks
+        self.rows = sum(len(block[7]) for block in blocks)
+
+    def __len__(self) -> int:
+        return self.rows
+
+def build_columns_all_hours(station_external_id: str, data: dict) -> StationColumns:
+    """
+    Backfill decoder: every hourly slot of every metric becomes a row
+    (build_rows_from_open_meteo keeps only the single picked hour).
+    The time axis is decoded once and shared by all metric series; each
+    series is masked against its nulls and kept as columns. A stamp that
+    repeats in the axis keeps its last value (one row per key, as
+    upsert_raw collapses them).
+    """
+    hourly = data.get("hourly", {})
+    times = hourly.get("time", [])
+    blocks = []
+    if times:
+        observed = decode_time_axis(times)
+        if len(set(observed)) < len(observed):
+            last = sorted({o: i for i, o in enumerate(observed)}.values())
+            times = [times[i] for i in last]
+            observed = [observed[i] for i in last]
         else:
-            row["value_num"] = None
-            row["value_text"] = str(v)
+            last = None
 
-        rows.append(row)
+        hourly_units = data.get("hourly_units", {}) or {}
+        for metric_code, (field, unit, kind) in METRICS.items():
+            series = hourly.get(field)
+            if not series:
+                continue
+            if last is not None:
+                series = [series[i] for i in last if i < len(series)]
+            series = series[:len(times)]
+            mask = [v is not None for v in series]
+            values = list(compress(series, mask))
+            if not values:
+                continue
+            if kind == "num":
+                values = list(map(float, values))
+            blocks.append((
+                metric_code, field, unit, hourly_units.get(field, unit) or unit, kind,
+                list(compress(times, mask)), list(compress(observed, mask)), values,
+            ))
 
-    return rows
+    return StationColumns(station_external_id, data.get("latitude"), data.get("longitude"), blocks)
 
-def upsert_raw(cur, run_id: str, rows: list[dict]) -> tuple[int, int, int]:
-    inserted = updated = deduped = 0
+def _rows_for(station_external_id: str, data: dict, window: tuple[date, date] = None,
+              target_hour: datetime = None):
+    if window is None:
+        return build_rows_from_open_meteo(station_external_id, data, target_hour)
+    return build_columns_all_hours(station_external_id, data)
 
-    for row in rows:
-        cur.execute("""
-          insert into public.raw_observations
-            (source, station_external_id, observed_at, metric_code,
-             value_num, value_text, unit, quality_flag, source_payload,
-             ingested_at, ingest_run_id)
-          values
-            (%s, %s, %s, %s,
-             %s, %s, %s, %s, %s,
-             now(), %s)
-          on conflict (source, station_external_id, observed_at, metric_code)
-          do update set
-             value_num      = excluded.value_num,
-             value_text     = excluded.value_text,
-             unit           = excluded.unit,
-             quality_flag   = excluded.quality_flag,
-             source_payload = excluded.source_payload,
-             ingested_at    = now(),
-             ingest_run_id  = excluded.ingest_run_id
-          returning (xmax = 0) as inserted_row
-        """, (
+def backfill_windows(date_from: date, date_to: date, chunk_days: int) -> list[tuple[date, date]]:
+    """Split [date_from, date_to] (inclusive) into consecutive windows of chunk_days."""
+    windows = []
+    step = timedelta(days=max(1, chunk_days))
+    start = date_from
+    while start <= date_to:
+        end = min(date_to, start + step - timedelta(days=1))
+        windows.append((start, end))
+        start = end + timedelta(days=1)
+    return windows
+
+RAW_KEY = ("source", "station_external_id", "observed_at", "metric_code")
+
+SQL_UPSERT_RAW = """
+  insert into public.raw_observations
+    (source, station_external_id, observed_at, metric_code,
+     value_num, value_text, unit, quality_flag, source_payload,
+     ingested_at, ingest_run_id)
+  values %s
+  on conflict (source, station_external_id, observed_at, metric_code)
+  do update set
+     value_num      = excluded.value_num,
+     value_text     = excluded.value_text,
+     unit           = excluded.unit,
+     quality_flag   = excluded.quality_flag,
+     source_payload = excluded.source_payload,
+     ingested_at    = now(),
+     ingest_run_id  = excluded.ingest_run_id
+  where (raw_observations.value_num, raw_observations.value_text,
+         raw_observations.unit, raw_observations.quality_flag)
+        is distinct from
+        (excluded.value_num, excluded.value_text,
+         excluded.unit, excluded.quality_flag)
+  returning (xmax = 0) as inserted_row,
+            source, station_external_id, observed_at, metric_code, ingested_at, value_num
+"""
+
+def upsert_raw(cur, run_id: str, rows: list[dict], written: list = None) -> tuple[int, int, int]:
+    """
+    Upsert a whole batch (any number of stations) in ONE statement.
+    Round-trip latency to the remote Postgres dominates ingest time, so
+    this replaces the old one-INSERT-per-metric-row loop.
+
+    Postgres refuses to touch the same row twice in one ON CONFLICT
+    statement, so duplicate keys inside the batch are collapsed first
+    (last one wins, same outcome as the sequential upserts had).
+
+    Change-aware: an existing row is only rewritten when value/unit/flag
+    actually differ. Re-ingesting an unchanged hour leaves the row (and its
+    source_payload, ingested_at, ingest_run_id) alone, so no dead tuple,
+    WAL or index churn. Those rows come back from RETURNING as nothing and
+    are counted as deduped:
+      inserted = new keys, updated = changed rows, deduped = unchanged rows
+
+    `written`, if given, receives every inserted/updated row with the
+    ingested_at the database stamped on it (--fused writes facts from it).
+    """
+    if not rows:
+        return 0, 0, 0
+
+    by_key = {tuple(row[k] for k in RAW_KEY): row for row in rows}
+    values = [
+        (
             row["source"],
             row["station_external_id"],
             row["observed_at"],
@@ -200,54 +649,884 @@ def upsert_raw(cur, run_id: str, rows: list[dict]) -> tuple[int, int, int]:
             row["unit"],
             row.get("quality_flag"),
             Json(row["source_payload"]),
-            run_id
-        ))
-        was_insert = cur.fetchone()[0]
-        if was_insert:
-            inserted += 1
-        else:
-            updated += 1
+            run_id,
+        )
+        for row in by_key.values()
+    ]
 
+    results = execute_values(
+        cur,
+        SQL_UPSERT_RAW,
+        values,
+        template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, now(), %s)",
+        page_size=len(values),
+        fetch=True,
+    )
+
+    inserted = sum(1 for r in results if r[0])
+    updated = len(results) - inserted
+    if written is not None:
+        for _, source, sid, observed_at, metric_code, ingested_at, _ in results:
+            written.append({**by_key[(source, sid, observed_at, metric_code)],
+                            "ingested_at": ingested_at})
+    deduped = len(rows) - len(results)
     return inserted, updated, deduped
 
+# StationColumns: source_payload = the block's shared part || the per-row
+# stamp and value (compact payloads keep the stamp in the context)
+RAW_COLUMNS_TEMPLATE = (
+    "(%s, %s, %s, %s, %s, %s, %s, %s,"
+    " %s::jsonb || jsonb_build_object('observed_at', %s, 'value', %s), now(), %s)"
+)
+RAW_COLUMNS_COMPACT_TEMPLATE = (
+    "(%s, %s, %s, %s, %s, %s, %s, %s,"
+    " %s::jsonb || jsonb_build_object('value', %s), now(), %s)"
+)
+
+def upsert_raw_columns(cur, run_id: str, stations: list[StationColumns], flush_rows: int,
+                       dims: DimensionCache = None, compact: bool = False,
+                       validation: dict = None, written: list = None) -> tuple[int, int, int]:
+    """
+    upsert_raw for backfill columns: one values tuple per row straight from
+    the columns (no row or payload dict), validated a column at a time when
+    `dims` is given (counts added to `validation`), sent in pages of
+    `flush_rows`. `written` receives the inserted/updated rows as returned
+    by the database (key, value_num, ingested_at), for stats / --fused /
+    compact contexts. Returns (inserted, updated, deduped).
+    """
+    provider = "OpenMeteo"
+    values = []
+    for st in stations:
+        for metric_code, field, unit, source_unit, kind, times, observed, vals in st.blocks:
+            shared = {"field": field, "metric_code": metric_code, "unit": source_unit}
+            if not compact:
+                shared.update({
+                    "provider": provider,
+                    "station_external_id": st.station_external_id,
+                    "latitude": st.latitude,
+                    "longitude": st.longitude,
+                })
+            shared = json.dumps(shared)
+
+            flags = repeat(None)
+            if dims is not None:
+                flags = validate_column(metric_code, vals, kind == "num", dims)
+                validation["validated_rows"] = validation.get("validated_rows", 0) + len(vals)
+                for flag in set(flags) - {None}:
+                    key = f"flagged_{flag}"
+                    validation[key] = validation.get(key, 0) + flags.count(flag)
+
+            num = kind == "num"
+            if compact:
+                values.extend(
+                    (provider, st.station_external_id, o, metric_code,
+                     v if num else None, None if num else str(v), unit, f, shared, v, run_id)
+                    for o, v, f in zip(observed, vals, flags)
+                )
+            else:
+                values.extend(
+                    (provider, st.station_external_id, o, metric_code,
+                     v if num else None, None if num else str(v), unit, f, shared, t, v, run_id)
+                    for t, o, v, f in zip(times, observed, vals, flags)
+                )
+
+    inserted = updated = 0
+    template = RAW_COLUMNS_COMPACT_TEMPLATE if compact else RAW_COLUMNS_TEMPLATE
+    for page in chunked(values, flush_rows):
+        results = execute_values(cur, SQL_UPSERT_RAW, page, template=template,
+                                 page_size=len(page), fetch=True)
+        page_inserted = sum(1 for r in results if r[0])
+        inserted += page_inserted
+        updated += len(results) - page_inserted
+        if written is not None:
+            written.extend(
+                {"source": source, "station_external_id": sid, "observed_at": observed_at,
+                 "metric_code": metric_code, "value_num": value_num, "ingested_at": ingested_at}
+                for _, source, sid, observed_at, metric_code, ingested_at, value_num in results
+            )
+    return inserted, updated, len(values) - inserted - updated
+
+# --fused: same change-aware upsert as jobs/transform_fact.py, fed from
+# rows already resolved to surrogate keys in process
+SQL_UPSERT_FACT = """
+  insert into public.fact_observation
+    (station_id, metric_id, observed_at, value_num, source, ingested_at, is_late, ingest_run_id)
+  values %s
+  on conflict (station_id, metric_id, observed_at)
+  do update set
+    value_num     = excluded.value_num,
+    source        = excluded.source,
+    ingested_at   = excluded.ingested_at,
+    is_late       = excluded.is_late,
+    ingest_run_id = excluded.ingest_run_id
+  where (fact_observation.value_num, fact_observation.source, fact_observation.is_late)
+        is distinct from
+        (excluded.value_num, excluded.source, excluded.is_late)
+  returning (xmax = 0) as inserted_row
+"""
+
+def upsert_fact(cur, run_id: str, written: list[dict], dims: DimensionCache,
+                stats: MetricStats = None) -> tuple[int, int, int, int]:
+    """
+    Fact rows for raw rows just written by upsert_raw (unchanged raw rows
+    have nothing new for the fact table). Mirrors transform_fact: numeric
+    rows only, current station version, late = ingested > observed + 24h.
+    Keys are resolved for the whole batch at once from the cache; rows
+    that resolve are added to `stats` (fact stage).
+    Returns (inserted, updated, unchanged, unresolved).
+    """
+    numeric = [row for row in written if row.get("value_num") is not None]
+    station_ids = dims.station_ids([row["station_external_id"] for row in numeric])
+    metric_ids = dims.metric_ids([row["metric_code"] for row in numeric])
+
+    resolved = [
+        (row, station_id, metric_id)
+        for row, station_id, metric_id in zip(numeric, station_ids, metric_ids)
+        if station_id is not None and metric_id is not None
+    ]
+    if stats is not None:
+        stats.add([row for row, _, _ in resolved])
+
+    values = [
+        (
+            station_id,
+            metric_id,
+            row["observed_at"],
+            row["value_num"],
+            row["source"],
+            row["ingested_at"],
+            row["ingested_at"] > row["observed_at"] + timedelta(hours=24),
+            run_id,
+        )
+        for row, station_id, metric_id in resolved
+    ]
+    unresolved = len(numeric) - len(values)
+
+    if not values:
+        return 0, 0, 0, unresolved
+
+    results = execute_values(cur, SQL_UPSERT_FACT, values, page_size=len(values), fetch=True)
+    inserted = sum(1 for (was_insert,) in results if was_insert)
+    updated = len(results) - inserted
+    return inserted, updated, len(values) - len(results), unresolved
+
+SQL_WRITE_CHECKPOINTS = """
+  insert into public.ops_ingest_checkpoint
+    (target_hour, station_external_id, run_id, rows_written, completed_at)
+  values %s
+  on conflict (target_hour, station_external_id)
+  do update set
+     run_id       = excluded.run_id,
+     rows_written = excluded.rows_written,
+     completed_at = excluded.completed_at
+"""
+
+SQL_ADOPT_CHECKPOINTS = """
+  with adopted as (
+    update public.ops_ingest_checkpoint c
+       set run_id = %(run_id)s
+      from public.ops_job_run j
+     where c.target_hour = %(target_hour)s
+       and c.run_id <> %(run_id)s
+       and j.run_id = c.run_id
+       and (j.status = 'failed'
+            or (j.status = 'started'
+                and j.started_at < now() - make_interval(mins => %(stale_minutes)s)))
+    returning c.station_external_id, j.run_id as old_run_id
+  ),
+  adopted_context as (
+    -- compact payloads: the shared context follows its rows
+    update public.raw_observation_context x
+       set ingest_run_id = %(run_id)s
+      from adopted a
+     where x.ingest_run_id = a.old_run_id
+       and x.station_external_id = a.station_external_id
+       and x.observed_at = %(target_hour)s
+    returning 1
+  ),
+  adopted_fact as (
+    -- --fused runs already wrote the fact rows; keep their lineage too
+    update public.fact_observation f
+       set ingest_run_id = %(run_id)s
+      from adopted a
+      join public.dim_station s
+        on s.station_external_id = a.station_external_id
+       and s.is_current = true
+     where f.ingest_run_id = a.old_run_id
+       and f.station_id = s.station_id
+       and f.observed_at = %(target_hour)s
+    returning 1
+  )
+  update public.raw_observations r
+     set ingest_run_id = %(run_id)s
+    from adopted a
+   where r.ingest_run_id = a.old_run_id
+     and r.station_external_id = a.station_external_id
+     and r.observed_at = %(target_hour)s
+"""
+
+SQL_WRITE_PAYLOAD_CONTEXT = """
+  insert into public.raw_observation_context
+    (ingest_run_id, source, station_external_id, observed_at, context)
+  values %s
+  on conflict (ingest_run_id, source, station_external_id, observed_at)
+  do nothing
+"""
+
+def write_payload_contexts(cur, run_id: str, contexts: dict) -> None:
+    """{(source, station_external_id, observed_at): context} -> raw_observation_context."""
+    if not contexts:
+        return
+    execute_values(
+        cur,
+        SQL_WRITE_PAYLOAD_CONTEXT,
+        [(run_id, *key, Json(ctx)) for key, ctx in contexts.items()],
+        page_size=len(contexts),
+    )
+
+def compact_rows(rows: list[dict]) -> tuple[list[dict], dict]:
+    """
+    Split each row's source_payload into the shared per-(station, hour)
+    context and the metric-specific slice.
+    Returns (rows with slice-only payloads, {(source, station, observed_at): context}).
+    vw_raw_observations_full puts the two back together for audit.
+    """
+    contexts = {}
+    compact = []
+    for row in rows:
+        payload = row["source_payload"]
+        key = tuple(row[k] for k in CONTEXT_KEY)
+        if key not in contexts:
+            contexts[key] = {k: payload[k] for k in PAYLOAD_CONTEXT_KEYS if k in payload}
+        compact.append({
+            **row,
+            "source_payload": {k: v for k, v in payload.items() if k not in PAYLOAD_CONTEXT_KEYS},
+        })
+    return compact, contexts
+
+def target_hour_for(now: datetime) -> datetime:
+    """The hourly slot ingested for `now`: the next full hour (or now, if on the hour)."""
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    return hour if hour == now else hour + timedelta(hours=1)
+
+def parse_target_hour(text: str) -> datetime:
+    """--target-hour: ISO hour, UTC unless an offset is given (e.g. 2025-06-01T13:00)."""
+    hour = datetime.fromisoformat(text)
+    if hour.tzinfo is None:
+        hour = hour.replace(tzinfo=timezone.utc)
+    hour = hour.astimezone(timezone.utc)
+    if hour != hour.replace(minute=0, second=0, microsecond=0):
+        raise ValueError("--target-hour must be on the hour")
+    return hour
+
+def load_checkpoints(cur, run_id: str, target_hour: datetime) -> set[str]:
+    """
+    Stations already ingested for `target_hour` by any earlier attempt.
+
+    Rows written by an attempt that did not succeed (failed, or crashed and
+    left 'started' for over ADOPT_STALE_MINUTES) are re-attached to this
+    run, both in raw_observations and in the checkpoint, so when this run
+    succeeds transform picks them up without the station being fetched
+    again. A run that is still going keeps its rows; its stations are
+    skipped here all the same.
+    """
+    cur.execute(SQL_ADOPT_CHECKPOINTS, {
+        "run_id": run_id,
+        "target_hour": target_hour,
+        "stale_minutes": ADOPT_STALE_MINUTES,
+    })
+    cur.execute("""
+      select station_external_id
+      from public.ops_ingest_checkpoint
+      where target_hour = %s
+    """, (target_hour,))
+    return {r[0] for r in cur.fetchall()}
+
+class RawWriter:
+    """
+    Buffers parsed rows per station and writes them through upsert_raw in
+    slices of `flush_rows`.
+
+    With `checkpoint_hour` set, every flush also records the flushed
+    stations in ops_ingest_checkpoint and commits, so the rows and the
+    checkpoint land atomically and a crash only loses the current buffer.
+
+    With `compact` set, payloads are split by compact_rows and the shared
+    context goes to raw_observation_context in the same transaction, after
+    the upsert and only for the keys it inserted or updated (a deduped row
+    keeps the context of the run that wrote it).
+
+    With `dims` set, every flush first validates its rows against the
+    row contract and the dim_metric bounds (validate_rows sets
+    quality_flag; counts in `validation`), and the rows it wrote are summed
+    per metric into ops_run_metric_stats (stage 'raw') in the same
+    transaction.
+
+    With `fused` set (--fused, needs `dims`), every slice also writes its
+    fact rows through upsert_fact in the same transaction, so no separate
+    transform pass has to read the raw rows back (stats stage 'fact').
+    """
+
+    def __init__(self, conn, run_id: str, flush_rows: int = PIPELINE_FLUSH_ROWS,
+                 checkpoint_hour: datetime = None, compact: bool = False,
+                 dims: DimensionCache = None, fused: bool = False):
+        self.conn = conn
+        self.run_id = run_id
+        self.flush_rows = max(1, flush_rows)
+        self.checkpoint_hour = checkpoint_hour
+        self.compact = compact
+        self.dims = dims
+        self.fused = fused and dims is not None
+        self.raw_stats = MetricStats(dims) if dims is not None else None
+        self.fact_stats = MetricStats(dims) if self.fused else None
+        self.validation: dict[str, int] = {}
+        self.inserted = self.updated = self.deduped = 0
+        self.fact_inserted = self.fact_updated = self.fact_unchanged = 0
+        self.fact_unresolved = 0
+        self.stations_written = 0
+        self._rows: list[dict] = []
+        self._columns: list[StationColumns] = []
+        self._column_rows = 0
+        self._stations: list[tuple[str, int]] = []
+
+    @property
+    def totals(self) -> tuple[int, int, int]:
+        return self.inserted, self.updated, self.deduped
+
+    @property
+    def fact_totals(self) -> tuple[int, int, int]:
+        return self.fact_inserted, self.fact_updated, self.fact_unchanged
+
+    @property
+    def buffered_rows(self) -> int:
+        return len(self._rows) + self._column_rows
+
+    def add(self, station_rows: list[tuple]) -> None:
+        """(station_external_id, row dicts or StationColumns) per station."""
+        for station_external_id, rows in station_rows:
+            if isinstance(rows, StationColumns):
+                self._columns.append(rows)
+                self._column_rows += len(rows)
+            else:
+                self._rows.extend(rows)
+            self._stations.append((str(station_external_id), len(rows)))
+
+    def _written(self, cur, written: list) -> None:
+        """Stats and --fused facts for rows upsert_raw* just wrote."""
+        if written is None:
+            return
+        if self.raw_stats is not None:
+            self.raw_stats.add(written)
+
+        if written and self.fused:
+            f_ins, f_upd, f_same, f_miss = upsert_fact(
+                cur, self.run_id, written, self.dims, self.fact_stats,
+            )
+            self.fact_inserted += f_ins
+            self.fact_updated += f_upd
+            self.fact_unchanged += f_same
+            self.fact_unresolved += f_miss
+
+    def flush(self) -> None:
+        if not self._stations:
+            return
+
+        with self.conn.cursor() as cur:
+            if self.dims is not None:
+                self.dims.ensure(cur)
+                for key, n in validate_rows(self._rows, self.dims).items():
+                    self.validation[key] = self.validation.get(key, 0) + n
+            for part in chunked(self._rows, self.flush_rows):
+                contexts = None
+                if self.compact:
+                    part, contexts = compact_rows(part)
+                written = [] if self.dims is not None or self.compact else None
+                ins, upd, ded = upsert_raw(cur, self.run_id, part, written)
+                self.inserted += ins
+                self.updated += upd
+                self.deduped += ded
+                if contexts:
+                    write_payload_contexts(cur, self.run_id, {
+                        key: contexts[key]
+                        for key in {tuple(row[k] for k in CONTEXT_KEY) for row in written}
+                    })
+
+                self._written(cur, written)
+
+            if self._columns:
+                written = [] if self.dims is not None or self.compact else None
+                ins, upd, ded = upsert_raw_columns(
+                    cur, self.run_id, self._columns, self.flush_rows,
+                    self.dims, self.compact, self.validation, written,
+                )
+                self.inserted += ins
+                self.updated += upd
+                self.deduped += ded
+                if self.compact and written:
+                    coords = {st.station_external_id: (st.latitude, st.longitude)
+                              for st in self._columns}
+                    write_payload_contexts(cur, self.run_id, {
+                        (row["source"], row["station_external_id"], row["observed_at"]): {
+                            "provider": row["source"],
+                            "station_external_id": row["station_external_id"],
+                            "latitude": coords[row["station_external_id"]][0],
+                            "longitude": coords[row["station_external_id"]][1],
+                            "observed_at": row["observed_at"].astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M"),
+                        }
+                        for row in written
+                    })
+                self._written(cur, written)
+
+            if self.raw_stats is not None:
+                self.raw_stats.write(cur, self.run_id, "raw")
+            if self.fact_stats is not None:
+                self.fact_stats.write(cur, self.run_id, "fact")
+
+            if self.checkpoint_hour is not None:
+                execute_values(
+                    cur,
+                    SQL_WRITE_CHECKPOINTS,
+                    [(self.checkpoint_hour, sid, self.run_id, n) for sid, n in self._stations],
+                    template="(%s, %s, %s, %s, now())",
+                    page_size=len(self._stations),
+                )
+
+        if self.checkpoint_hour is not None:
+            self.conn.commit()
+
+        self.stations_written += len(self._stations)
+        self._rows = []
+        self._columns = []
+        self._column_rows = 0
+        self._stations = []
+
+def _station_rows(fetched: list[tuple[str, dict]], window: tuple[date, date] = None,
+                  target_hour: datetime = None, failures: list = None) -> list[tuple]:
+    """
+    Decoded rows per fetched station. A station whose payload lacks the
+    target hour is left out (no rows, no checkpoint) and recorded in
+    `failures` when given, else MissingTargetHour propagates.
+    """
+    station_rows = []
+    for station_external_id, data in fetched:
+        try:
+            station_rows.append(
+                (station_external_id, _rows_for(station_external_id, data, window, target_hour))
+            )
+        except MissingTargetHour as e:
+            if failures is None:
+                raise
+            failures.append((station_external_id, str(e)))
+    return station_rows
+
+def ingest_sequential(writer: RawWriter, chunks: list[list], concurrency: int,
+                      window: tuple[date, date] = None, target_hour: datetime = None,
+                      failures: list = None) -> None:
+    """
+    Default mode: write each fetched chunk as it comes back from the pool.
+    """
+    for fetched in iter_fetched_chunks(chunks, concurrency, window, failures):
+        writer.add(_station_rows(fetched, window, target_hour, failures))
+        writer.flush()
+
+_PIPELINE_DONE = object()
+
+class _PipelineFailure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+def ingest_pipeline(writer: RawWriter, chunks: list[list], concurrency: int,
+                    window: tuple[date, date] = None, target_hour: datetime = None,
+                    failures: list = None,
+                    queue_size: int = PIPELINE_QUEUE_SIZE) -> None:
+    """
+    Streaming mode (--pipeline): overlap HTTP fetch with DB writes.
+
+    - producer thread: runs the fetch pool, parses each chunk into rows and
+      puts them on a bounded queue (blocks when the writer falls behind,
+      which in turn stops new fetches from being submitted)
+    - writer (this thread, owns the connection): drains the queue and
+      flushes once `writer.flush_rows` rows are buffered, or whenever the
+      queue runs dry so the DB never waits on a half-full buffer
+
+    A fetch error travels through the queue and is re-raised here; a write
+    error stops the producer. Either way the producer thread is joined
+    before returning, so no fetch outlives the run.
+    """
+    q = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for fetched in iter_fetched_chunks(chunks, concurrency, window, failures):
+                if not put(_station_rows(fetched, window, target_hour, failures)):
+                    return
+            put(_PIPELINE_DONE)
+        except BaseException as e:
+            put(_PipelineFailure(e))
+
+    producer = threading.Thread(target=produce, name="ingest-producer", daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                writer.flush()
+                item = q.get()
+
+            if item is _PIPELINE_DONE:
+                break
+            if isinstance(item, _PipelineFailure):
+                raise item.exc
+
+            writer.add(item)
+            if writer.buffered_rows >= writer.flush_rows:
+                writer.flush()
+
+        writer.flush()
+
+    finally:
+        stop.set()
+        producer.join()
+
+def _ingest(writer: RawWriter, chunks: list[list], opts: dict,
+            window: tuple[date, date] = None, target_hour: datetime = None,
+            failures: list = None) -> None:
+    if opts["pipeline"]:
+        ingest_pipeline(
+            writer, chunks, opts["concurrency"], window, target_hour, failures,
+            queue_size=opts["queue_size"],
+        )
+    else:
+        ingest_sequential(writer, chunks, opts["concurrency"], window, target_hour, failures)
+
+def run_backfill(conn, stations: list[tuple], opts: dict,
+                 date_from: date, date_to: date, chunk_days: int) -> int:
+    """
+    --backfill FROM TO: rebuild history from the archive API.
+
+    The range is cut into windows of `chunk_days`; each window is its own
+    ingest run (same job_name as the scheduled ingest, so transform/DQ pick
+    it up as usual) with watermark_from/watermark_to set to the window and
+    run_stats.backfill = true (stats_fact_late_rate skips it: history is
+    late by definition), and is committed on its own. A failure only loses the current window, and
+    re-running the same range dedups the windows that already landed.
+    With --fused each window also gets its child transform run.
+    """
+    chunks = chunked(plan_fetch_units(stations, opts["grid_resolution"]), opts["batch_size"])
+    failed = 0
+
+    for window in backfill_windows(date_from, date_to, chunk_days):
+        run_id = transform_run_id = None
+        try:
+            with conn.cursor() as cur:
+                run_id = start_job(cur, INGEST_JOB_NAME)
+                record_run_stats(cur, run_id, {"backfill": True})
+                if opts["fused"]:
+                    transform_run_id = start_job(cur, TRANSFORM_JOB_NAME, run_id)
+            conn.commit()
+
+            writer = RawWriter(conn, run_id, opts["flush_rows"], compact=opts["compact"],
+                               dims=DIM_CACHE, fused=opts["fused"])
+            _ingest(writer, chunks, opts, window)
+            ins, upd, ded = writer.totals
+
+            with conn.cursor() as cur:
+                set_watermarks(
+                    cur, run_id,
+                    datetime.combine(window[0], datetime.min.time(), timezone.utc),
+                    datetime.combine(window[1], datetime.max.time(), timezone.utc),
+                )
+                finish_job(cur, run_id, "succeeded",
+                           rows_inserted=ins, rows_updated=upd, rows_deduped=ded)
+                record_run_stats(cur, run_id, {**fetch_stats(), **writer.validation})
+                if opts["fused"]:
+                    finish_fused_transform(cur, transform_run_id, "succeeded", writer)
+            conn.commit()
+            print(f"backfill {window[0]}..{window[1]}: inserted={ins} updated={upd} deduped={ded}")
+
+        except Exception as e:
+            failed += 1
+            err = f"{type(e).__name__}: {e}"
+            tb = traceback.format_exc(limit=5)
+            conn.rollback()
+            if run_id:
+                with conn.cursor() as cur:
+                    finish_job(cur, run_id, "failed", error_message=(err + "\n" + tb)[:4000])
+                    record_run_stats(cur, run_id, fetch_stats())
+                    if transform_run_id:
+                        finish_job(cur, transform_run_id, "failed", error_message=err[:4000])
+                conn.commit()
+            print(f"backfill {window[0]}..{window[1]} FAILED: {err}", file=sys.stderr)
+
+    return 1 if failed else 0
+
+def finish_fused_transform(cur, transform_run_id: str, status: str, writer: RawWriter,
+                           error_message: str = None):
+    """--fused: close the child transform run with the fact counts the writer collected."""
+    f_ins, f_upd, f_same = writer.fact_totals
+    finish_job(cur, transform_run_id, status, error_message=error_message,
+               rows_inserted=f_ins, rows_updated=f_upd, rows_deduped=f_same)
+    record_run_stats(cur, transform_run_id, {
+        "fused": True,
+        "fact_unresolved": writer.fact_unresolved,
+        "dim_cache_loads": DIM_CACHE.loads,
+    })
+
+def _cli_value(flag: str, default=None):
+    if flag not in sys.argv:
+        return default
+    i = sys.argv.index(flag)
+    if i + 1 >= len(sys.argv):
+        raise ValueError(f"Missing value for {flag}")
+    return sys.argv[i + 1]
+
+def load_stations(cur) -> list[tuple]:
+    cur.execute("""
+      select station_external_id, lat, lon
+      from public.dim_station
+      where is_current = true
+        and lat is not null
+        and lon is not null
+        and is_smoketest = false;
+    """)
+    return cur.fetchall()
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """'i/n' -> (i, n), with 0 <= i < n."""
+    try:
+        i, n = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Bad --shard {spec!r}, expected i/n (e.g. 0/4)")
+    if n < 1 or not 0 <= i < n:
+        raise ValueError(f"Bad --shard {spec!r}, need 0 <= i < n")
+    return i, n
+
+def shard_of(station_external_id: str, n: int) -> int:
+    # crc32 rather than hash(): stable across processes and runners
+    return zlib.crc32(str(station_external_id).encode("utf-8")) % n
+
+def shard_job_name(i: int, n: int) -> str:
+    return f"{INGEST_JOB_NAME}_shard_{i}_of_{n}"
+
+def finalize_sharded_parent(cur, parent_run_id: str, n: int):
+    """
+    Called by every shard when it finishes (succeeded or failed).
+
+    The parent ingest run (the one raw rows are tagged with, and the one
+    transform/DQ key on) is marked succeeded only once all n shard job
+    names have a succeeded run under it; rows/watermarks are summed from
+    the latest success of each shard. While any shard is still running (or
+    has not started) the parent stays 'started', even if a sibling already
+    failed: it is only marked failed once every shard's latest run is
+    terminal, and a successful retry of the failed shards still flips it
+    to succeeded.
+    The parent row is locked so two shards finishing together agree.
+    """
+    cur.execute("""
+      select status from public.ops_job_run where run_id = %s for update
+    """, (parent_run_id,))
+
+    cur.execute("""
+      select
+        count(*),
+        coalesce(sum(rows_inserted), 0),
+        coalesce(sum(rows_updated), 0),
+        coalesce(sum(rows_deduped), 0),
+        min(watermark_from),
+        max(watermark_to)
+      from (
+        select distinct on (job_name) *
+        from public.ops_job_run
+        where parent_run_id = %s
+          and job_name like %s
+          and status = 'succeeded'
+        order by job_name, ended_at desc
+      ) s
+    """, (parent_run_id, f"{INGEST_JOB_NAME}_shard_%_of_{n}"))
+    shards_ok, ins, upd, ded, wm_from, wm_to = cur.fetchone()
+
+    if shards_ok == n:
+        set_watermarks(cur, parent_run_id, wm_from, wm_to)
+        finish_job(cur, parent_run_id, "succeeded",
+                   rows_inserted=ins, rows_updated=upd, rows_deduped=ded)
+        return
+
+    # per shard job name: its latest attempt, and whether any attempt succeeded
+    cur.execute("""
+      select
+        count(*) filter (where ok or status = 'failed'),
+        string_agg(job_name, ', ' order by job_name) filter (where not ok and status = 'failed')
+      from (
+        select distinct on (job_name)
+          job_name,
+          status,
+          bool_or(status = 'succeeded') over (partition by job_name) as ok
+        from public.ops_job_run
+        where parent_run_id = %s
+          and job_name like %s
+        order by job_name, started_at desc
+      ) s
+    """, (parent_run_id, f"{INGEST_JOB_NAME}_shard_%_of_{n}"))
+    terminal, failed = cur.fetchone()
+    if terminal == n and failed:
+        finish_job(cur, parent_run_id, "failed",
+                   error_message=f"{shards_ok}/{n} shards succeeded; failed: {failed}"[:4000])
+
 def main():
+    global SESSION, RESPONSE_CACHE
+
+    try:
+        opts = {
+            "batch_size": int(_cli_value("--batch-size", FETCH_BATCH_SIZE)),
+            "concurrency": int(_cli_value("--concurrency", FETCH_CONCURRENCY)),
+            "queue_size": int(_cli_value("--queue-size", PIPELINE_QUEUE_SIZE)),
+            "flush_rows": int(_cli_value("--flush-rows", PIPELINE_FLUSH_ROWS)),
+            "pipeline": "--pipeline" in sys.argv,
+            "grid_resolution": float(_cli_value("--grid-resolution", GRID_RESOLUTION)),
+            "compact": "--compact-payload" in sys.argv or COMPACT_PAYLOAD,
+            "fused": "--fused" in sys.argv,
+        }
+        rate_limit = float(_cli_value("--rate-limit", FETCH_RATE_LIMIT))
+        cache_dir = _cli_value("--cache-dir", CACHE_DIR)
+        offline = "--offline" in sys.argv or CACHE_OFFLINE
+        if offline and not cache_dir:
+            raise ValueError("--offline needs a cache (--cache-dir or INGEST_CACHE_DIR)")
+        chunk_days = int(_cli_value("--chunk-days", BACKFILL_CHUNK_DAYS))
+        target_hour = _cli_value("--target-hour")
+        if target_hour:
+            if not offline:
+                raise ValueError("--target-hour needs --offline (it replays a recorded hour from the cache)")
+            target_hour = parse_target_hour(target_hour)
+
+        shard = None
+        parent_run_id = _cli_value("--parent-run-id")
+        if "--shard" in sys.argv:
+            shard = parse_shard(_cli_value("--shard"))
+            if not parent_run_id:
+                raise ValueError("--shard needs --parent-run-id (create one with --start-parent)")
+            if opts["fused"]:
+                raise ValueError("--fused cannot be combined with --shard")
+
+        backfill = None
+        if "--backfill" in sys.argv:
+            i = sys.argv.index("--backfill")
+            if i + 2 >= len(sys.argv):
+                raise ValueError("Usage: --backfill FROM TO (YYYY-MM-DD, inclusive)")
+            backfill = (date.fromisoformat(sys.argv[i + 1]), date.fromisoformat(sys.argv[i + 2]))
+            if backfill[0] > backfill[1]:
+                raise ValueError("--backfill FROM must not be after TO")
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    if opts["concurrency"] > FETCH_CONCURRENCY:
+        SESSION = _build_retrying_session(max(10, opts["concurrency"]))
+    RATE_LIMITER.configure(rate_limit)
+    LIMITER.configure(opts["concurrency"])
+
     conn = psycopg2.connect(DATABASE_URL)
     conn.autocommit = False
-    run_id = None
+    run_id = transform_run_id = None
 
     try:
+        if "--start-parent" in sys.argv:
+            # sharded runs: one parent for all `--shard i/n --parent-run-id <id>` workers
+            with conn.cursor() as cur:
+                parent = start_job(cur, INGEST_JOB_NAME)
+            conn.commit()
+            print(parent)
+            return 0
+
+        def open_cache(scope):
+            if not cache_dir:
+                return None
+            return ResponseCache(cache_dir, CACHE_TTL_SECONDS, int(CACHE_MAX_MB * 1024 * 1024),
+                                 offline=offline, scope=scope)
+
+        if backfill:
+            RESPONSE_CACHE = open_cache(None)  # archive ranges are keyed by their dates
+            with conn.cursor() as cur:
+                stations = load_stations(cur)
+            conn.commit()
+            return run_backfill(conn, stations, opts, backfill[0], backfill[1], chunk_days)
+
+        target_hour = target_hour or target_hour_for(datetime.now(timezone.utc))
+        RESPONSE_CACHE = open_cache(target_hour.isoformat())
+
         with conn.cursor() as cur:
-            run_id = start_job(cur, "ingest_openmeteo_all_stations")
+            if shard:
+                run_id = start_job(cur, shard_job_name(*shard), parent_run_id)
+            else:
+                run_id = start_job(cur, INGEST_JOB_NAME)
+            if opts["fused"]:
+                # facts are written alongside raw; the child transform run is
+                # what transform_fact skips on and run_dq waits for
+                transform_run_id = start_job(cur, TRANSFORM_JOB_NAME, run_id)
         conn.commit()
 
-        total_ins = total_upd = total_ded = 0
+        # sharded: rows and checkpoints belong to the shared parent run
+        data_run_id = parent_run_id if shard else run_id
 
         with conn.cursor() as cur:
-            cur.execute("""
-              select station_external_id, lat, lon
-              from public.dim_station
-              where is_current = true
-                and lat is not null
-                and lon is not null
-                and is_smoketest = false;
-            """)
-            stations = cur.fetchall()
-
-        for station_external_id, lat, lon in stations:
-            data = fetch_open_meteo(float(lat), float(lon))
-            rows = build_rows_from_open_meteo(station_external_id, data)
+            stations = load_stations(cur)
+            if shard:
+                stations = [st for st in stations if shard_of(st[0], shard[1]) == shard[0]]
+            done = set() if "--fresh" in sys.argv else load_checkpoints(cur, data_run_id, target_hour)
+        conn.commit()
 
-            with conn.cursor() as cur:
-                ins, upd, ded = upsert_raw(cur, run_id, rows)
-                total_ins += ins
-                total_upd += upd
-                total_ded += ded
+        pending = [st for st in stations if str(st[0]) not in done]
+        failures: list[tuple[str, str]] = []
+
+        writer = RawWriter(conn, data_run_id, opts["flush_rows"],
+                           checkpoint_hour=target_hour, compact=opts["compact"],
+                           dims=DIM_CACHE, fused=opts["fused"])
+        units = plan_fetch_units(pending, opts["grid_resolution"])
+        _ingest(writer, chunked(units, opts["batch_size"]), opts,
+                target_hour=target_hour, failures=failures)
+        total_ins, total_upd, total_ded = writer.totals
 
         with conn.cursor() as cur:
-            finish_job(cur, run_id, "succeeded",
-                       rows_inserted=total_ins, rows_updated=total_upd, rows_deduped=total_ded)
+            set_watermarks(cur, run_id, target_hour, target_hour)
+            record_run_stats(cur, run_id, {**fetch_stats(), **writer.validation})
+            if failures:
+                # stations that made it are checkpointed; a retry only fetches these
+                err = f"{len(failures)} of {len(pending)} stations failed: " + "; ".join(
+                    f"{sid}: {msg}" for sid, msg in failures
+                )
+                finish_job(cur, run_id, "failed", error_message=err[:4000],
+                           rows_inserted=total_ins, rows_updated=total_upd, rows_deduped=total_ded)
+            else:
+                finish_job(cur, run_id, "succeeded",
+                           rows_inserted=total_ins, rows_updated=total_upd, rows_deduped=total_ded)
+            if transform_run_id:
+                finish_fused_transform(cur, transform_run_id,
+                                       "failed" if failures else "succeeded", writer)
+            if shard:
+                finalize_sharded_parent(cur, parent_run_id, shard[1])
         conn.commit()
-        print("OK")
+
+        summary = (f"inserted={total_ins} updated={total_upd} deduped={total_ded} "
+                   f"stations={writer.stations_written} locations={len(units)} "
+                   f"skipped={len(stations) - len(pending)}")
+        if transform_run_id:
+            f_ins, f_upd, f_same = writer.fact_totals
+            summary += f" fact_inserted={f_ins} fact_updated={f_upd} fact_unchanged={f_same}"
+        if failures:
+            print(f"FAILED {summary} failed={len(failures)}", file=sys.stderr)
+            return 1
+        print(f"OK {summary}")
         return 0
 
     except Exception as e:
@@ -255,8 +1534,16 @@ def main():
         tb = traceback.format_exc(limit=5)
         try:
             if conn and run_id:
+                # drop the unflushed buffer; flushed stations are already
+                # committed with their checkpoint and get adopted by the retry
+                conn.rollback()
                 with conn.cursor() as cur:
                     finish_job(cur, run_id, "failed", error_message=(err + "\n" + tb)[:4000])
+                    record_run_stats(cur, run_id, fetch_stats())
+                    if transform_run_id:
+                        finish_job(cur, transform_run_id, "failed", error_message=err[:4000])
+                    if shard:
+                        finalize_sharded_parent(cur, parent_run_id, shard[1])
                 conn.commit()
         except Exception:
             pass
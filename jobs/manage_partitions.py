@@ -0,0 +1,250 @@
+# ============================================
+# jobs/manage_partitions.py
+# Maintenance for the monthly fact_observation partitions
+# (db/migrations/005_fact_observation_partitioned.sql)
+#
+#   python -m jobs.manage_partitions                 # pre-create PARTITION_AHEAD_MONTHS
+#   python -m jobs.manage_partitions --ahead 6
+#   python -m jobs.manage_partitions --retain-months 24            # archive older months
+#   python -m jobs.manage_partitions --retain-months 24 --drop     # drop instead of archive
+#   python -m jobs.manage_partitions --ensure 2023-01 2023-12      # e.g. before a backfill
+#   python -m jobs.manage_partitions --dry-run
+# ============================================
+
+import os
+import re
+import sys
+import traceback
+from datetime import date, datetime, timezone
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import Json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ["OBS_DATABASE_URL"]
+
+JOB_NAME = "manage_fact_partitions"
+
+PARENT_TABLE = "fact_observation"
+DEFAULT_PARTITION = "fact_observation_default"
+ARCHIVE_SCHEMA = "fact_archive"
+PARTITION_RE = re.compile(r"^fact_observation_p(\d{4})(\d{2})$")
+
+PARTITION_AHEAD_MONTHS = int(os.environ.get("PARTITION_AHEAD_MONTHS", "3"))
+# 0 = keep every month attached
+PARTITION_RETAIN_MONTHS = int(os.environ.get("PARTITION_RETAIN_MONTHS", "0"))
+
+
+def add_months(month: date, n: int) -> date:
+    y, m = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return date(y, m + 1, 1)
+
+def parse_month(text: str) -> date:
+    """YYYY-MM -> first day of that month."""
+    return datetime.strptime(text, "%Y-%m").date()
+
+def partition_name(month: date) -> str:
+    return f"fact_observation_p{month:%Y%m}"
+
+def month_bounds(month: date) -> tuple[datetime, datetime]:
+    lo = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    hi_month = add_months(month, 1)
+    hi = datetime(hi_month.year, hi_month.month, 1, tzinfo=timezone.utc)
+    return lo, hi
+
+def list_partitions(cur) -> dict:
+    """Attached monthly partitions: {first day of month: table name}."""
+    cur.execute(
+        """
+        select c.relname
+        from pg_inherits i
+        join pg_class c on c.oid = i.inhrelid
+        where i.inhparent = 'public.fact_observation'::regclass
+        """
+    )
+    months = {}
+    for (name,) in cur.fetchall():
+        m = PARTITION_RE.match(name)
+        if m:
+            months[date(int(m.group(1)), int(m.group(2)), 1)] = name
+    return months
+
+def create_partition(cur, month: date) -> int:
+    """
+    Create + attach the partition for `month`. Rows that already landed in
+    the default partition for that range are moved into it first (attach
+    would otherwise fail). Returns the number of rows moved.
+    """
+    name = partition_name(month)
+    lo, hi = month_bounds(month)
+    table = sql.Identifier("public", name)
+
+    cur.execute(
+        sql.SQL(
+            "create table {} (like public.fact_observation including defaults including constraints)"
+        ).format(table)
+    )
+    cur.execute(
+        sql.SQL(
+            """
+            with moved as (
+              delete from public.fact_observation_default
+              where observed_at >= %s and observed_at < %s
+              returning *
+            )
+            insert into {} select * from moved
+            """
+        ).format(table),
+        (lo, hi),
+    )
+    moved = cur.rowcount or 0
+    cur.execute(
+        sql.SQL("alter table public.fact_observation attach partition {} for values from (%s) to (%s)")
+        .format(table),
+        (lo, hi),
+    )
+    # no policies on the partition itself: only reachable through the parent
+    cur.execute(sql.SQL("alter table {} enable row level security").format(table))
+    return moved
+
+def retire_partition(cur, name: str, drop: bool) -> None:
+    """Detach an old month; move it to fact_archive (or drop it)."""
+    table = sql.Identifier("public", name)
+    cur.execute(sql.SQL("alter table public.fact_observation detach partition {}").format(table))
+    if drop:
+        cur.execute(sql.SQL("drop table {}").format(table))
+    else:
+        cur.execute(
+            sql.SQL("alter table {} set schema {}").format(table, sql.Identifier(ARCHIVE_SCHEMA))
+        )
+
+def default_partition_rows(cur) -> int:
+    cur.execute("select count(*) from public.fact_observation_default")
+    return cur.fetchone()[0]
+
+def start_job(cur, job_name: str) -> str:
+    cur.execute(
+        """
+        insert into public.ops_job_run (job_name, status, started_at)
+        values (%s, 'started', now())
+        returning run_id
+        """,
+        (job_name,),
+    )
+    return cur.fetchone()[0]
+
+def finish_job(cur, run_id: str, status: str, stats: dict = None, error_message=None):
+    cur.execute(
+        """
+        update public.ops_job_run
+           set status = %s,
+               ended_at = now(),
+               error_message = %s,
+               run_stats = coalesce(run_stats, '{}'::jsonb) || %s
+         where run_id = %s
+        """,
+        (status, error_message, Json(stats or {}), run_id),
+    )
+
+def _cli_value(flag: str, default=None):
+    if flag not in sys.argv:
+        return default
+    i = sys.argv.index(flag)
+    if i + 1 >= len(sys.argv):
+        raise ValueError(f"Missing value for {flag}")
+    return sys.argv[i + 1]
+
+def main() -> int:
+    try:
+        ahead = int(_cli_value("--ahead", PARTITION_AHEAD_MONTHS))
+        retain = int(_cli_value("--retain-months", PARTITION_RETAIN_MONTHS))
+        drop = "--drop" in sys.argv
+        dry_run = "--dry-run" in sys.argv
+
+        current = datetime.now(timezone.utc).date().replace(day=1)
+        wanted = [add_months(current, i) for i in range(ahead + 1)]
+
+        if "--ensure" in sys.argv:
+            i = sys.argv.index("--ensure")
+            if i + 2 >= len(sys.argv):
+                raise ValueError("Usage: --ensure FROM TO (YYYY-MM, inclusive)")
+            m, last = parse_month(sys.argv[i + 1]), parse_month(sys.argv[i + 2])
+            if m > last:
+                raise ValueError("--ensure FROM must not be after TO")
+            while m <= last:
+                wanted.append(m)
+                m = add_months(m, 1)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.autocommit = False
+    run_id = None
+
+    try:
+        with conn.cursor() as cur:
+            if not dry_run:
+                run_id = start_job(cur, JOB_NAME)
+                conn.commit()
+
+            existing = list_partitions(cur)
+            to_create = sorted(set(wanted) - set(existing))
+            cutoff = add_months(current, -retain) if retain > 0 else None
+            to_retire = sorted(
+                (m, name) for m, name in existing.items()
+                if cutoff is not None and m < cutoff and m not in wanted
+            )
+
+            if dry_run:
+                for m in to_create:
+                    print(f"would create {partition_name(m)}")
+                for _, name in to_retire:
+                    print(f"would {'drop' if drop else 'archive'} {name}")
+                return 0
+
+            moved = 0
+            for m in to_create:
+                moved += create_partition(cur, m)
+            for _, name in to_retire:
+                retire_partition(cur, name, drop)
+
+            stats = {
+                "partitions_created": [partition_name(m) for m in to_create],
+                "partitions_retired": [name for _, name in to_retire],
+                "retired_to": "dropped" if drop else ARCHIVE_SCHEMA,
+                "rows_moved_from_default": moved,
+                "default_partition_rows": default_partition_rows(cur),
+            }
+            finish_job(cur, run_id, "succeeded", stats)
+        conn.commit()
+
+        print(
+            f"OK created={len(to_create)} retired={len(to_retire)} "
+            f"moved_from_default={moved} default_rows={stats['default_partition_rows']}"
+        )
+        return 0
+
+    except Exception as e:
+        err = f"{type(e).__name__}: {e}"
+        tb = traceback.format_exc(limit=5)
+        try:
+            conn.rollback()
+            if run_id:
+                with conn.cursor() as cur:
+                    finish_job(cur, run_id, "failed", error_message=(err + "\n" + tb)[:4000])
+                conn.commit()
+        except Exception:
+            pass
+        print(err, file=sys.stderr)
+        print(tb, file=sys.stderr)
+        return 1
+
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,106 @@
+# ============================================
+# jobs/metric_stats.py
+# Per-run, per-metric statistics (ops_run_metric_stats), accumulated
+# while rows stream through ingest / transform, so DQ checks can read a
+# few rows per run instead of rescanning raw_observations / fact_observation
+# ============================================
+
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
+from jobs.dim_cache import DimensionCache
+
+LATE_AFTER = timedelta(hours=24)  # same rule as fact_observation.is_late
+
+# additive: several flushes (or shards, or incremental transform passes)
+# of one run add up
+SQL_ADD_METRIC_STATS_ON_CONFLICT = """
+  on conflict (run_id, stage, metric_code)
+  do update set
+    rows_total  = ops_run_metric_stats.rows_total  + excluded.rows_total,
+    value_nulls = ops_run_metric_stats.value_nulls + excluded.value_nulls,
+    value_min   = least(ops_run_metric_stats.value_min, excluded.value_min),
+    value_max   = greatest(ops_run_metric_stats.value_max, excluded.value_max),
+    value_sum   = ops_run_metric_stats.value_sum   + excluded.value_sum,
+    value_sumsq = ops_run_metric_stats.value_sumsq + excluded.value_sumsq,
+    below_min   = ops_run_metric_stats.below_min   + excluded.below_min,
+    above_max   = ops_run_metric_stats.above_max   + excluded.above_max,
+    late_rows   = ops_run_metric_stats.late_rows   + excluded.late_rows,
+    updated_at  = now()
+"""
+
+SQL_ADD_METRIC_STATS = """
+  insert into public.ops_run_metric_stats
+    (run_id, stage, metric_code, rows_total, value_nulls, value_min, value_max,
+     value_sum, value_sumsq, below_min, above_max, late_rows, updated_at)
+  values %s
+""" + SQL_ADD_METRIC_STATS_ON_CONFLICT
+
+# stats recomputed for a whole run replace what was there
+SQL_REPLACE_METRIC_STATS_ON_CONFLICT = """
+  on conflict (run_id, stage, metric_code)
+  do update set
+    rows_total  = excluded.rows_total,
+    value_nulls = excluded.value_nulls,
+    value_min   = excluded.value_min,
+    value_max   = excluded.value_max,
+    value_sum   = excluded.value_sum,
+    value_sumsq = excluded.value_sumsq,
+    below_min   = excluded.below_min,
+    above_max   = excluded.above_max,
+    late_rows   = excluded.late_rows,
+    updated_at  = now()
+"""
+
+class MetricStats:
+    """
+    Running count / nulls / min / max / sum / sumsq / out-of-range / late
+    per metric_code for rows of one run. add() takes row dicts as built by
+    jobs.ingest (value_num, metric_code, observed_at, ingested_at); bounds
+    come from dim_metric via the DimensionCache.
+    """
+
+    def __init__(self, dims: DimensionCache):
+        self.dims = dims
+        self._stats: dict[str, list] = {}
+
+    def add(self, rows: list[dict]) -> None:
+        if not rows:
+            return
+        codes = [row["metric_code"] for row in rows]
+        for row, code, (lo, hi) in zip(rows, codes, self.dims.metric_bounds(codes)):
+            s = self._stats.get(code)
+            if s is None:
+                s = self._stats[code] = [0, 0, None, None, 0.0, 0.0, 0, 0, 0]
+            s[0] += 1
+
+            ingested_at = row.get("ingested_at")
+            if ingested_at is not None and ingested_at > row["observed_at"] + LATE_AFTER:
+                s[8] += 1
+
+            v = row.get("value_num")
+            if v is None:
+                s[1] += 1
+                continue
+            s[2] = v if s[2] is None else min(s[2], v)
+            s[3] = v if s[3] is None else max(s[3], v)
+            s[4] += v
+            s[5] += v * v
+            if lo is not None and v < lo:
+                s[6] += 1
+            if hi is not None and v > hi:
+                s[7] += 1
+
+    def write(self, cur, run_id: str, stage: str) -> None:
+        """Add the accumulated stats to ops_run_metric_stats and reset."""
+        if not self._stats:
+            return
+        execute_values(
+            cur,
+            SQL_ADD_METRIC_STATS,
+            [(run_id, stage, code, *s) for code, s in self._stats.items()],
+            template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, now())",
+            page_size=len(self._stats),
+        )
+        self._stats = {}
@@ -0,0 +1,217 @@
+# ============================================
+# jobs/rate_limit.py
+# Thread-safe request pacing for the ingest fetch engine
+# ============================================
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class RateLimiter:
+    """
+    Token bucket: at most `rate` acquisitions per second on average,
+    with bursts of up to `burst`. rate <= 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class PerHostRateLimiter:
+    """
+    One RateLimiter per URL host, so every worker thread talking to the
+    same provider shares a single budget.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.burst = burst
+        self._limiters: dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, rate: float, burst: int = None) -> None:
+        with self._lock:
+            self.rate = float(rate)
+            if burst is not None:
+                self.burst = burst
+            self._limiters.clear()
+
+    def acquire(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = RateLimiter(self.rate, self.burst)
+                self._limiters[host] = limiter
+        limiter.acquire()
+
+
+class AdaptiveLimiter:
+    """
+    Shared across all fetch threads of a run:
+
+    - concurrency limit that adapts AIMD-style: halves on a throttle
+      signal (429/5xx), grows by one after `limit` clean responses, never
+      above `max_limit` (the thread pool size) or below `min_limit`
+    - one global pause: a Retry-After from any response holds back every
+      thread, instead of each request sleeping on its own schedule
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._successes = 0
+        self._pause_until = 0.0
+        self.min_limit = max(1, min_limit)
+        self.configure(max_limit)
+        self._reset_stats()
+
+    def configure(self, max_limit: int) -> None:
+        with self._cond:
+            self.max_limit = max(self.min_limit, int(max_limit))
+            self.limit = self.max_limit
+            self._cond.notify_all()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self._pause_until:
+                    self._cond.wait(self._pause_until - now)
+                elif self._in_use < self.limit:
+                    self._in_use += 1
+                    return
+                else:
+                    self._cond.wait()
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def on_throttle(self, retry_after: float = 0.0) -> None:
+        with self._cond:
+            self.throttled += 1
+            self._successes = 0
+            self.limit = max(self.min_limit, self.limit // 2)
+            self.lowest_limit = min(self.lowest_limit, self.limit)
+
+            if retry_after > 0:
+                now = time.monotonic()
+                until = now + retry_after
+                if until > self._pause_until:
+                    self.paused_seconds += until - max(self._pause_until, now)
+                    self._pause_until = until
+
+    def _reset_stats(self) -> None:
+        self.throttled = 0
+        self.paused_seconds = 0.0
+        self.lowest_limit = self.limit
+
+    def take_stats(self) -> dict:
+        """Throttle counters since the last call (per job run)."""
+        with self._cond:
+            stats = {
+                "throttled_responses": self.throttled,
+                "throttle_pause_seconds": round(self.paused_seconds, 1),
+                "lowest_concurrency": self.lowest_limit,
+            }
+            self._reset_stats()
+        return stats
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a provider that keeps failing."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures (any thread). While open,
+    check() raises CircuitOpen immediately. After `cooldown` seconds one
+    probe is let through (half-open) while every other caller is still
+    rejected: success closes it, failure re-opens it for another cooldown.
+    A probe that reports nothing within `cooldown` is given up on and the
+    next caller probes instead. threshold <= 0 disables the breaker.
+    """
+
+    def __init__(self, threshold: int, cooldown: float = 60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def check(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            if now - self._opened_at >= self.cooldown and (
+                self._probe_started is None or now - self._probe_started >= self.cooldown
+            ):
+                self._probe_started = now
+                return
+            self.rejected += 1
+            raise CircuitOpen(
+                f"circuit open after {self.threshold} consecutive failures"
+            )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_started = None
+
+    def record_failure(self) -> None:
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._probe_started is not None:
+                # half-open probe failed: open again for a full cooldown
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+                self.opened += 1
+            elif self._failures >= self.threshold and self._opened_at is None:
+                self._opened_at = time.monotonic()
+                self.opened += 1
+
+    def take_stats(self) -> dict:
+        with self._lock:
+            stats = {"breaker_opened": self.opened, "breaker_rejected": self.rejected}
+            self.opened = self.rejected = 0
+        return stats
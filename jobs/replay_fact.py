@@ -0,0 +1,361 @@
+# ============================================
+# jobs/replay_fact.py
+# Rebuild fact_observation from raw_observations over an observed_at range
+# (e.g. after a dim_metric / dim_station mapping fix), then the 'fact'
+# ops_run_metric_stats of the ingest runs it touched
+#
+#   python -m jobs.replay_fact --range 2025-01-01 2025-03-31
+#   python -m jobs.replay_fact --range 2025-01-01 2025-03-31 --workers 8 --chunk-hours 6
+#   python -m jobs.replay_fact --resume <replay run_id>
+# ============================================
+
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from datetime import date, datetime, time as dtime, timedelta, timezone
+
+import psycopg2
+from dotenv import load_dotenv
+
+from jobs.transform_fact import (
+    NO_ROWS,
+    SQL_FACT_SRC_TEMPLATE,
+    SQL_FACT_STATS_CTE,
+    SQL_INSERT_FACT_TEMPLATE,
+    TRANSFORM_INCREMENTAL_JOB_NAME,
+    TRANSFORM_JOB_NAME,
+    fetch_run_counts,
+    finish_job,
+    start_job,
+    total_counts,
+)
+
+load_dotenv()
+
+DATABASE_URL = os.environ["OBS_DATABASE_URL"]
+
+REPLAY_JOB_NAME = "replay_raw_to_fact"
+REPLAY_CHUNK_JOB_NAME = "replay_raw_to_fact_chunk"
+
+REPLAY_WORKERS = int(os.environ.get("REPLAY_WORKERS", "4"))
+REPLAY_CHUNK_HOURS = int(os.environ.get("REPLAY_CHUNK_HOURS", "24"))
+
+# Same change-aware upsert as transform_fact, selected by observed_at
+# instead of ingest run: replaying a chunk twice leaves facts untouched
+# the second time (counted as unchanged).
+SQL_REPLAY_CHUNK = SQL_INSERT_FACT_TEMPLATE.format(
+    run_filter="r.observed_at >= %(lo)s\n    and r.observed_at < %(hi)s",
+    stats="",  # a chunk holds parts of many runs
+)
+
+# ...so the 'fact' stats of the ingest runs a replay touched are rebuilt
+# once all chunks are done, from each run's whole raw rows (the replay
+# may have remapped or dropped some). The observed_at bound is the span
+# of those runs' watermarks, so ix_raw_observations_observed_at is used.
+# Only runs the regular transform is done with: a run --incremental has
+# not fully passed yet still gets slices added to its stats later
+SQL_TOUCHED_RUNS = """
+  select
+    array_agg(j.run_id),
+    min(j.watermark_from),
+    max(j.watermark_to),
+    bool_and(j.watermark_from is not null and j.watermark_to is not null)
+  from public.ops_job_run j
+  where j.run_id in (
+    select distinct r.ingest_run_id
+    from public.raw_observations r
+    where r.observed_at >= %(lo)s
+      and r.observed_at < %(hi)s
+  )
+  and (
+    exists (
+      select 1
+      from public.ops_job_run t
+      where t.parent_run_id = j.run_id
+        and t.job_name = %(transform)s
+        and t.status = 'succeeded'
+    )
+    or j.ended_at <= (
+      select max(i.watermark_to)
+      from public.ops_job_run i
+      where i.job_name = %(incremental)s
+        and i.status = 'succeeded'
+    )
+  )
+"""
+
+SQL_CLEAR_FACT_STATS = """
+  delete from public.ops_run_metric_stats
+  where run_id = any(%(runs)s::uuid[])
+    and stage = 'fact'
+"""
+
+SQL_REFRESH_FACT_STATS = (
+    "with src as (" + SQL_FACT_SRC_TEMPLATE.format(
+        run_filter="r.ingest_run_id = any(%(runs)s::uuid[])\n"
+                   "    and r.observed_at >= %(lo)s\n"
+                   "    and r.observed_at <= %(hi)s",
+    ) + "\n)," + SQL_FACT_STATS_CTE.rstrip(",") + "\nselect count(distinct ingest_run_id) from src"
+)
+
+_CONN = None
+
+
+def replay_chunks(ts_from: datetime, ts_to: datetime, chunk_hours: int) -> list[tuple]:
+    """[ts_from, ts_to) cut into half-open (lo, hi) chunks of chunk_hours."""
+    step = timedelta(hours=max(1, chunk_hours))
+    chunks = []
+    lo = ts_from
+    while lo < ts_to:
+        hi = min(lo + step, ts_to)
+        chunks.append((lo, hi))
+        lo = hi
+    return chunks
+
+def set_watermarks(cur, run_id: str, watermark_from: datetime, watermark_to: datetime):
+    cur.execute(
+        """
+        update public.ops_job_run
+           set watermark_from = %s,
+               watermark_to = %s
+         where run_id = %s
+        """,
+        (watermark_from, watermark_to, run_id),
+    )
+
+def refresh_fact_stats(cur, ts_from: datetime, ts_to: datetime) -> int:
+    """
+    Replace the 'fact' ops_run_metric_stats of every finished-transforming
+    ingest run with raw rows in [ts_from, ts_to). Returns the number of
+    runs refreshed.
+    """
+    cur.execute(SQL_TOUCHED_RUNS, {
+        "lo": ts_from,
+        "hi": ts_to,
+        "transform": TRANSFORM_JOB_NAME,
+        "incremental": TRANSFORM_INCREMENTAL_JOB_NAME,
+    })
+    runs, lo, hi, bounded = cur.fetchone()
+    if not runs:
+        return 0
+    if not bounded:
+        lo, hi = "-infinity", "infinity"
+    params = {"runs": [str(r) for r in runs], "lo": lo, "hi": hi}
+    cur.execute(SQL_CLEAR_FACT_STATS, params)
+    cur.execute(SQL_REFRESH_FACT_STATS, params)
+    return len(runs)
+
+def load_replay(cur, replay_run_id: str) -> tuple[datetime, datetime, int]:
+    """Range + chunk size of an earlier replay run (for --resume)."""
+    cur.execute(
+        """
+        select watermark_from, watermark_to, run_stats ->> 'chunk_hours'
+        from public.ops_job_run
+        where run_id = %s
+          and job_name = %s
+        """,
+        (replay_run_id, REPLAY_JOB_NAME),
+    )
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"No {REPLAY_JOB_NAME} run {replay_run_id}")
+    return row[0], row[1], int(row[2] or REPLAY_CHUNK_HOURS)
+
+def load_done_chunks(cur, replay_run_id: str) -> set[tuple]:
+    """Chunks of this replay that already succeeded (by their watermarks)."""
+    cur.execute(
+        """
+        select watermark_from, watermark_to
+        from public.ops_job_run
+        where parent_run_id = %s
+          and job_name = %s
+          and status = 'succeeded'
+        """,
+        (replay_run_id, REPLAY_CHUNK_JOB_NAME),
+    )
+    return {(lo, hi) for lo, hi in cur.fetchall()}
+
+def _init_worker():
+    global _CONN
+    _CONN = psycopg2.connect(DATABASE_URL)
+    _CONN.autocommit = False
+
+def replay_chunk(args: tuple) -> tuple:
+    """
+    Worker: one chunk = one child run + one upsert statement, on this
+    process's own connection. Returns (lo, hi, counts, seconds, error).
+    """
+    replay_run_id, lo, hi = args
+    started = time.monotonic()
+    chunk_run_id = None
+    try:
+        with _CONN.cursor() as cur:
+            chunk_run_id = start_job(cur, REPLAY_CHUNK_JOB_NAME, parent_run_id=replay_run_id)
+            set_watermarks(cur, chunk_run_id, lo, hi)
+        _CONN.commit()
+
+        with _CONN.cursor() as cur:
+            cur.execute(SQL_REPLAY_CHUNK, {"lo": lo, "hi": hi})
+            counts = total_counts(fetch_run_counts(cur))
+            finish_job(cur, chunk_run_id, "succeeded", counts)
+        _CONN.commit()
+        return lo, hi, counts, time.monotonic() - started, None
+
+    except Exception as e:
+        err = f"{type(e).__name__}: {e}"
+        try:
+            _CONN.rollback()
+            if chunk_run_id:
+                with _CONN.cursor() as cur:
+                    finish_job(cur, chunk_run_id, "failed", error_message=err[:4000])
+                _CONN.commit()
+        except Exception:
+            pass
+        return lo, hi, NO_ROWS, time.monotonic() - started, err
+
+def _cli_value(flag: str, default=None):
+    if flag not in sys.argv:
+        return default
+    i = sys.argv.index(flag)
+    if i + 1 >= len(sys.argv):
+        raise ValueError(f"Missing value for {flag}")
+    return sys.argv[i + 1]
+
+def main() -> int:
+    try:
+        workers = int(_cli_value("--workers", REPLAY_WORKERS))
+        chunk_hours = int(_cli_value("--chunk-hours", REPLAY_CHUNK_HOURS))
+        resume_run_id = _cli_value("--resume")
+        if not resume_run_id:
+            if "--range" not in sys.argv:
+                raise ValueError("Usage: --range FROM TO (YYYY-MM-DD, inclusive) or --resume RUN_ID")
+            i = sys.argv.index("--range")
+            if i + 2 >= len(sys.argv):
+                raise ValueError("Usage: --range FROM TO (YYYY-MM-DD, inclusive)")
+            d_from, d_to = date.fromisoformat(sys.argv[i + 1]), date.fromisoformat(sys.argv[i + 2])
+            if d_from > d_to:
+                raise ValueError("--range FROM must not be after TO")
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.autocommit = False
+    replay_run_id = None
+
+    try:
+        with conn.cursor() as cur:
+            if resume_run_id:
+                replay_run_id = resume_run_id
+                ts_from, ts_to, chunk_hours = load_replay(cur, replay_run_id)
+                done = load_done_chunks(cur, replay_run_id)
+                cur.execute(
+                    """
+                    update public.ops_job_run
+                       set status = 'started', ended_at = null, error_message = null
+                     where run_id = %s
+                    """,
+                    (replay_run_id,),
+                )
+            else:
+                ts_from = datetime.combine(d_from, dtime.min, timezone.utc)
+                ts_to = datetime.combine(d_to + timedelta(days=1), dtime.min, timezone.utc)
+                replay_run_id = start_job(cur, REPLAY_JOB_NAME)
+                set_watermarks(cur, replay_run_id, ts_from, ts_to)
+                cur.execute(
+                    """
+                    update public.ops_job_run
+                       set run_stats = coalesce(run_stats, '{}'::jsonb)
+                                       || jsonb_build_object('chunk_hours', %s::int)
+                     where run_id = %s
+                    """,
+                    (chunk_hours, replay_run_id),
+                )
+                done = set()
+        conn.commit()
+
+        chunks = [c for c in replay_chunks(ts_from, ts_to, chunk_hours) if c not in done]
+        print(f"replay {replay_run_id}: {ts_from} -> {ts_to}, "
+              f"{len(chunks)} chunks to do, {len(done)} already done")
+
+        totals = [0, 0, 0]
+        failed = []
+        started = time.monotonic()
+
+        with multiprocessing.Pool(max(1, workers), initializer=_init_worker) as pool:
+            tasks = [(str(replay_run_id), lo, hi) for lo, hi in chunks]
+            for i, (lo, hi, counts, seconds, err) in enumerate(
+                pool.imap_unordered(replay_chunk, tasks), start=1
+            ):
+                if err:
+                    failed.append((lo, err))
+                    print(f"[{i}/{len(chunks)}] {lo} .. {hi} FAILED: {err}", file=sys.stderr)
+                    continue
+                for k in range(3):
+                    totals[k] += counts[k]
+                rows = sum(counts)
+                elapsed = time.monotonic() - started
+                print(
+                    f"[{i}/{len(chunks)}] {lo} .. {hi}: {rows} rows in {seconds:.1f}s "
+                    f"({rows / seconds if seconds else 0:.0f} rows/s), "
+                    f"overall {sum(totals) / elapsed if elapsed else 0:.0f} rows/s"
+                )
+
+        elapsed = time.monotonic() - started
+        rows_per_sec = round(sum(totals) / elapsed, 1) if elapsed else 0.0
+
+        with conn.cursor() as cur:
+            status = "failed" if failed else "succeeded"
+            err = None
+            if failed:
+                err = f"{len(failed)} of {len(chunks)} chunks failed (re-run with --resume): " + "; ".join(
+                    f"{lo}: {msg}" for lo, msg in failed
+                )
+            # a failed replay is resumed; its stats are refreshed when that succeeds
+            stats_runs = 0 if failed else refresh_fact_stats(cur, ts_from, ts_to)
+            finish_job(cur, replay_run_id, status, tuple(totals), error_message=err and err[:4000])
+            cur.execute(
+                """
+                update public.ops_job_run
+                   set run_stats = coalesce(run_stats, '{}'::jsonb)
+                                   || jsonb_build_object('rows_per_sec', %s::numeric,
+                                                         'workers', %s::int,
+                                                         'chunks_failed', %s::int,
+                                                         'fact_stats_runs', %s::int)
+                 where run_id = %s
+                """,
+                (rows_per_sec, workers, len(failed), stats_runs, replay_run_id),
+            )
+        conn.commit()
+
+        summary = (f"inserted={totals[0]} updated={totals[1]} unchanged={totals[2]} "
+                   f"rows_per_sec={rows_per_sec}")
+        if failed:
+            print(f"FAILED {summary} failed_chunks={len(failed)} (resume: --resume {replay_run_id})",
+                  file=sys.stderr)
+            return 1
+        print(f"OK {summary}")
+        return 0
+
+    except Exception as e:
+        err = f"{type(e).__name__}: {e}"
+        tb = traceback.format_exc(limit=5)
+        try:
+            conn.rollback()
+            if replay_run_id:
+                with conn.cursor() as cur:
+                    finish_job(cur, replay_run_id, "failed", error_message=(err + "\n" + tb)[:4000])
+                conn.commit()
+        except Exception:
+            pass
+        print(err, file=sys.stderr)
+        print(tb, file=sys.stderr)
+        return 1
+
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,19 @@
+import hashlib
+import json
 import os
+import sys
+import threading
+import time
 import uuid
 import traceback
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.errors import InvalidSqlStatementName, QueryCanceled
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,6 +24,19 @@ INGEST_JOB_NAME = "ingest_openmeteo_all_stations"
 TRANSFORM_JOB_NAME = "transform_raw_to_fact"
 DQ_JOB_NAME = "dq_check_run"
 
+# ingest runs evaluated together (one grouped query per check)
+DQ_BATCH_SIZE = int(os.environ.get("DQ_BATCH_SIZE", "200"))
+
+# checks run in parallel, each on its own pooled connection; every
+# statement is cancelled after DQ_CHECK_TIMEOUT_MS (0 = no limit), and a
+# grouped query that is cancelled is retried one run at a time
+DQ_WORKERS = int(os.environ.get("DQ_WORKERS", "4"))
+DQ_CHECK_TIMEOUT_MS = int(os.environ.get("DQ_CHECK_TIMEOUT_MS", "60000"))
+
+# also run EXPLAIN (ANALYZE) once per check and batch to split planning
+# from execution time (the check query runs twice); or pass --profile
+DQ_PROFILE = os.environ.get("DQ_PROFILE", "0") == "1"
+
 
 def utcnow():
     return datetime.now(timezone.utc)
@@ -107,54 +129,367 @@ def finish_job(cur, run_id, status, rows_inserted=0, error_message=None):
     )
 
 
-def run_dq_for_ingest_run(cur, ingest_run_id):
-    checks = load_active_checks(cur)
-    inserted = 0
+def wrap_check_for_runs(template):
+    """
+    Turn a per-run check template (uses %(run_id)s) into one query over
+    many runs: the template becomes a LATERAL subquery evaluated once per
+    run_id of %(run_ids)s, first row only (same as fetchone() per run).
+    """
+    body = template.strip().rstrip(";").replace("%(run_id)s", "b.dq_batch_run_id")
+    return f"""
+        select b.dq_batch_run_id, t.*
+        from unnest(%(run_ids)s::uuid[]) as b (dq_batch_run_id)
+        left join lateral (
+          select * from (
+            {body}
+          ) q
+          limit 1
+        ) t on true
+    """
+
+
+def _metric_value(row, skip=()):
+    if row is None:
+        raise ValueError("check returned no row")
+    if "metric_value" in row:
+        return row["metric_value"]
+    return next(v for k, v in row.items() if k not in skip)
+
+
+def prepared_check_sql(template):
+    """
+    Body for PREPARE ... (uuid[]) AS: the grouped query with the run ids
+    as $1. The template is sent without parameters, so psycopg2's %%
+    escaping is undone here.
+    """
+    return wrap_check_for_runs(template).replace("%(run_ids)s", "$1").replace("%%", "%")
+
+
+class PreparedChecks:
+    """
+    Server-side prepared statements for the grouped check queries, per
+    pooled connection (prepared statements belong to a session).
+
+    A statement is named after the check id and a hash of its template,
+    so an edited definition gets a new statement and the old one is
+    deallocated on that connection. A template that does not prepare is
+    remembered and goes through the plain (text) path. PREPARE is not
+    undone by the rollback at the end of each check. Entries are keyed on
+    the connection object itself, so a closed connection takes its
+    statements with it; a statement the server no longer has is evicted
+    and prepared again (evict()).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # conn -> {dq_check_id: (template hash, name or None)}
+        self._by_conn = weakref.WeakKeyDictionary()
+
+    def evict(self, conn, check):
+        with self._lock:
+            prepared = self._by_conn.get(conn)
+        if prepared is not None:
+            prepared.pop(check["dq_check_id"], None)
+
+    def statement(self, conn, cur, check):
+        """Returns (statement name or None, prepare_ms; 0 when reused)."""
+        template = check["check_sql_template"]
+        digest = hashlib.sha1(template.encode("utf-8")).hexdigest()[:12]
+        with self._lock:
+            prepared = self._by_conn.setdefault(conn, {})
+
+        cached = prepared.get(check["dq_check_id"])
+        if cached is not None and cached[0] == digest:
+            return cached[1], 0
+        if cached is not None and cached[1] is not None:
+            cur.execute("savepoint dq_prepare")
+            try:
+                cur.execute(f"deallocate {cached[1]}")
+            except InvalidSqlStatementName:
+                cur.execute("rollback to savepoint dq_prepare")
+            cur.execute("release savepoint dq_prepare")
+
+        name = f"dq_check_{int(check['dq_check_id'])}_{digest}"
+        started = time.monotonic()
+        cur.execute("savepoint dq_prepare")
+        try:
+            cur.execute(f"prepare {name} (uuid[]) as {prepared_check_sql(template)}")
+            cur.execute("release savepoint dq_prepare")
+        except Exception:
+            cur.execute("rollback to savepoint dq_prepare")
+            cur.execute("release savepoint dq_prepare")
+            name = None
+        prepared[check["dq_check_id"]] = (digest, name)
+        return name, int((time.monotonic() - started) * 1000)
+
+
+def explain_prepared(cur, name, run_ids):
+    """(planning_ms, execution_ms) of one EXPLAIN ANALYZE EXECUTE."""
+    cur.execute(f"explain (analyze, format json) execute {name} (%s::uuid[])", (run_ids,))
+    plan = next(iter(cur.fetchone().values()))
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0].get("Planning Time"), plan[0].get("Execution Time")
+
+
+def evaluate_check(cur, check, run_ids, statement=None, profile=False):
+    """
+    Evaluate one check for many runs. Returns ({run_id: metric_value or
+    Exception}, {run_id: duration_ms}, details). Tries the grouped query
+    first (every run gets that query's duration), as EXECUTE of the
+    prepared `statement` when there is one; a template that cannot be
+    wrapped (or errors, or hits the statement timeout) falls back to one
+    query per run, each under the same per-statement timeout, and an
+    error there only affects that run: a heavy check over a large
+    backlog still completes the runs it can. A prepared statement
+    missing on the server (InvalidSqlStatementName) is raised for the
+    caller to re-prepare, not treated as a template error.
+
+    details (for ops_dq_check_run.details) says how the check ran; with
+    `profile`, it also holds planning vs execution time from EXPLAIN
+    ANALYZE of the prepared statement.
+    """
+    results = {}
+    durations = {}
+    details = {"prepared_statement": statement}
+
+    cur.execute("savepoint dq_check")
+    started = time.monotonic()
+    try:
+        if statement is not None:
+            if profile:
+                details["planning_ms"], details["execution_ms"] = explain_prepared(
+                    cur, statement, run_ids,
+                )
+                started = time.monotonic()
+            cur.execute(f"execute {statement} (%s::uuid[])", (run_ids,))
+        else:
+            cur.execute(wrap_check_for_runs(check["check_sql_template"]), {"run_ids": run_ids})
+        for row in cur.fetchall():
+            run_id = str(row["dq_batch_run_id"])
+            if all(v is None for k, v in row.items() if k != "dq_batch_run_id"):
+                results[run_id] = ValueError("check returned no row")
+            else:
+                results[run_id] = _metric_value(row, skip=("dq_batch_run_id",))
+        cur.execute("release savepoint dq_check")
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+        return results, {run_id: elapsed_ms for run_id in results}, details
+    except InvalidSqlStatementName:
+        cur.execute("rollback to savepoint dq_check")
+        cur.execute("release savepoint dq_check")
+        raise
+    except Exception as e:
+        cur.execute("rollback to savepoint dq_check")
+        cur.execute("release savepoint dq_check")
+        grouped_error = e
+
+    details = {"prepared_statement": None, "per_run_fallback": True}
+    if isinstance(grouped_error, QueryCanceled):
+        details["grouped_timed_out"] = True
+
+    for run_id in run_ids:
+        cur.execute("savepoint dq_check")
+        started = time.monotonic()
+        try:
+            cur.execute(check["check_sql_template"], {"run_id": run_id})
+            results[run_id] = _metric_value(cur.fetchone())
+        except Exception as e:
+            cur.execute("rollback to savepoint dq_check")
+            results[run_id] = e
+        durations[run_id] = int((time.monotonic() - started) * 1000)
+        cur.execute("release savepoint dq_check")
+
+    return results, durations, details
+
+
+def run_check_pooled(pool, check, run_ids, timeout_ms, prepared=None, profile=False):
+    """
+    One check on its own pooled connection, with its own statement
+    timeout. Checks are read-only, so the transaction is rolled back.
+    With `prepared` (PreparedChecks), the grouped query runs as a
+    prepared statement on that connection.
+    """
+    conn = pool.getconn()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("set local statement_timeout = %s", (int(timeout_ms),))
+            statement, prepare_ms = None, None
+            if prepared is not None:
+                statement, prepare_ms = prepared.statement(conn, cur, check)
+            try:
+                results, durations, details = evaluate_check(cur, check, run_ids, statement, profile)
+            except InvalidSqlStatementName:
+                # cache out of step with the session: prepare again, once
+                prepared.evict(conn, check)
+                statement, prepare_ms = prepared.statement(conn, cur, check)
+                results, durations, details = evaluate_check(cur, check, run_ids, statement, profile)
+            if prepare_ms is not None and details.get("prepared_statement"):
+                details["prepare_ms"] = prepare_ms
+            return results, durations, details
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
 
-    for c in checks:
-        # Run the check SQL
-        cur.execute(c["check_sql_template"], {"run_id": ingest_run_id})
-        row = cur.fetchone()
 
-        metric_value = (
-            row["metric_value"] if isinstance(row, dict) else row[0]
-        )
+def start_jobs(cur, job_name, parent_run_ids):
+    """One 'started' job per parent in one insert. Returns {parent_run_id: run_id}."""
+    run_ids = {str(p): str(uuid.uuid4()) for p in parent_run_ids}
+    execute_values(
+        cur,
+        """
+        insert into public.ops_job_run
+          (run_id, job_name, status, started_at, parent_run_id,
+           rows_inserted, rows_updated, rows_deduped)
+        values %s
+        """,
+        [(run_id, job_name, "started", utcnow(), parent) for parent, run_id in run_ids.items()],
+        template="(%s, %s, %s, %s, %s, 0, 0, 0)",
+    )
+    return run_ids
 
-        status = evaluate_status(
-            metric_value,
-            c["threshold_value"],
-            c["threshold_operator"],
-            c["severity"],
-        )
 
-        # INSERT WITH dq_check_id (FIX)
-        cur.execute(
-            """
-            insert into public.ops_dq_check_run
-              (dq_check_id, run_id, check_name, status, metric_value, threshold)
-            values
-              (%s, %s, %s, %s, %s, %s)
-            on conflict (run_id, check_name) do nothing;
-            """,
-            (
-                c["dq_check_id"],
-                ingest_run_id,
-                c["check_name"],
-                status,
-                metric_value,
-                c["threshold_value"],
-            ),
+def finish_jobs(cur, results):
+    """results: [(run_id, status, rows_inserted, error_message)] in one update."""
+    execute_values(
+        cur,
+        """
+        update public.ops_job_run j
+           set status = v.status,
+               ended_at = now(),
+               rows_inserted = v.rows_inserted,
+               error_message = v.error_message
+          from (values %s) as v (run_id, status, rows_inserted, error_message)
+         where j.run_id = v.run_id::uuid;
+        """,
+        results,
+        template="(%s, %s, %s::int, %s::text)",
+    )
+
+
+def _evaluate_and_write(conn, pool, checks, ingest_run_ids, workers, timeout_ms,
+                        prepared=None, profile=False):
+    errors = {}
+    rows = []
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        futures = [
+            (c, ex.submit(run_check_pooled, pool, c, ingest_run_ids, timeout_ms, prepared, profile))
+            for c in checks
+        ]
+        evaluated = [(c, *f.result()) for c, f in futures]
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        for c, results, durations, details in evaluated:
+            if profile and details.get("planning_ms") is not None:
+                print(
+                    f"  {c['check_name']}: planning {details['planning_ms']:.1f} ms, "
+                    f"execution {details['execution_ms']:.1f} ms"
+                )
+            for run_id, metric_value in results.items():
+                try:
+                    if isinstance(metric_value, Exception):
+                        raise metric_value
+                    status = evaluate_status(
+                        metric_value,
+                        c["threshold_value"],
+                        c["threshold_operator"],
+                        c["severity"],
+                    )
+                except Exception as e:
+                    errors.setdefault(run_id, f"{c['check_name']}: {type(e).__name__}: {e}")
+                    continue
+                rows.append((
+                    c["dq_check_id"],
+                    run_id,
+                    c["check_name"],
+                    status,
+                    metric_value,
+                    c["threshold_value"],
+                    durations.get(run_id),
+                    Json(details),
+                ))
+
+        rows = [r for r in rows if r[1] not in errors]
+        inserted = {}
+        if rows:
+            written = execute_values(
+                cur,
+                """
+                insert into public.ops_dq_check_run
+                  (dq_check_id, run_id, check_name, status, metric_value, threshold, duration_ms, details)
+                values %s
+                on conflict (run_id, check_name) do nothing
+                returning run_id;
+                """,
+                rows,
+                page_size=len(rows),
+                fetch=True,
+            )
+            for r in written:
+                inserted[str(r["run_id"])] = inserted.get(str(r["run_id"]), 0) + 1
+
+    return errors, inserted
+
+
+def run_dq_batch(conn, pool, ingest_run_ids, checks,
+                 workers=DQ_WORKERS, timeout_ms=DQ_CHECK_TIMEOUT_MS,
+                 prepared=None, profile=False):
+    """
+    All active checks for a batch of ingest runs:
+    one grouped query per check (not per run x check), checks running in
+    parallel on `pool` (up to `workers` at a time), one multi-row
+    insert into ops_dq_check_run, and one dq_check_run job per ingest run
+    as before. A run whose check errors gets its dq job marked failed and
+    none of its results written, like the per-run loop did. With
+    `prepared`, grouped queries run as prepared statements (see
+    PreparedChecks).
+    """
+    ingest_run_ids = [str(r) for r in ingest_run_ids]
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        dq_run_ids = start_jobs(cur, DQ_JOB_NAME, ingest_run_ids)
+    conn.commit()
+
+    try:
+        errors, inserted = _evaluate_and_write(
+            conn, pool, checks, ingest_run_ids, workers, timeout_ms, prepared, profile,
         )
+    except Exception as e:
+        conn.rollback()
+        err = f"{type(e).__name__}: {e}"
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            finish_jobs(cur, [(dq_run_ids[r], "failed", 0, err[:4000]) for r in ingest_run_ids])
+        conn.commit()
+        raise
 
-        if cur.rowcount == 1:
-            inserted += 1
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        finish_jobs(cur, [
+            (
+                dq_run_ids[run_id],
+                "failed" if run_id in errors else "succeeded",
+                inserted.get(run_id, 0),
+                errors[run_id][:4000] if run_id in errors else None,
+            )
+            for run_id in ingest_run_ids
+        ])
+    conn.commit()
 
-    return inserted
+    return inserted, errors
 
 
 def main():
+    workers = DQ_WORKERS
+    if "--workers" in sys.argv:
+        i = sys.argv.index("--workers")
+        if i + 1 >= len(sys.argv):
+            print("Missing value for --workers", file=sys.stderr)
+            return 2
+        workers = int(sys.argv[i + 1])
+    profile = DQ_PROFILE or "--profile" in sys.argv
+
     conn = psycopg2.connect(DATABASE_URL)
     conn.autocommit = False
+    pool = None
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -164,34 +499,42 @@ def main():
             print("No eligible ingest runs for DQ.")
             return
 
-        for ingest_run_id in ingest_runs:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                dq_run_id = start_job(cur, DQ_JOB_NAME, ingest_run_id)
-                conn.commit()
+        # minconn = maxconn: psycopg2 closes a returned connection once
+        # minconn idle ones are pooled, so anything less reconnects per check
+        workers = max(1, workers)
+        pool = ThreadedConnectionPool(workers, workers, DATABASE_URL)
+        prepared = PreparedChecks()
 
+        for i in range(0, len(ingest_runs), DQ_BATCH_SIZE):
+            batch = ingest_runs[i:i + DQ_BATCH_SIZE]
             try:
+                # re-read per batch: an edited definition gets a new
+                # template hash and is re-prepared
                 with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    inserted = run_dq_for_ingest_run(cur, ingest_run_id)
-                    finish_job(cur, dq_run_id, "succeeded", inserted)
-                    conn.commit()
+                    checks = load_active_checks(cur)
+                conn.commit()
+
+                inserted, errors = run_dq_batch(
+                    conn, pool, batch, checks, workers,
+                    prepared=prepared, profile=profile,
+                )
+                print(
+                    f"DQ batch of {len(batch)} runs: {sum(inserted.values())} results, "
+                    f"{len(errors)} runs failed"
+                )
 
             except Exception as e:
                 err = f"{type(e).__name__}: {e}"
                 tb = traceback.format_exc(limit=8)
                 conn.rollback()
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    finish_job(
-                        cur,
-                        dq_run_id,
-                        "failed",
-                        0,
-                        err + "\n" + tb[:4000],
-                    )
-                    conn.commit()
+                print(err, file=sys.stderr)
+                print(tb, file=sys.stderr)
 
     finally:
+        if pool is not None:
+            pool.closeall()
         conn.close()
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
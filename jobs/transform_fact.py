@@ -1,46 +1,180 @@
 import os
 import sys
 import traceback
+from datetime import datetime, timedelta, timezone
 
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
+from jobs.metric_stats import SQL_ADD_METRIC_STATS_ON_CONFLICT, SQL_REPLACE_METRIC_STATS_ON_CONFLICT
+
 load_dotenv()
 
 DATABASE_URL = os.environ["OBS_DATABASE_URL"]
 
 INGEST_JOB_NAME = "ingest_openmeteo_all_stations"
 TRANSFORM_JOB_NAME = "transform_raw_to_fact"
+INGEST_SHARD_JOB_PATTERN = INGEST_JOB_NAME + "_shard_%"
+
+TRANSFORM_INCREMENTAL_JOB_NAME = "transform_raw_to_fact_incremental"
+
+# --batch: ingest runs transformed per statement (TRANSFORM_BATCH_SIZE)
+TRANSFORM_BATCH_SIZE = int(os.environ.get("TRANSFORM_BATCH_SIZE", "100"))
+
+# --incremental: ingested_at is the writer's transaction start time, so a
+# raw write still open when the watermark is cut would later commit rows
+# below it. The watermark is therefore capped at the started_at of the
+# oldest ingest run still 'started' (a backfill can hold one transaction
+# for hours); runs 'started' for longer than WATERMARK_STALE_RUN_HOURS
+# are taken as crashed and no longer hold it back. The lag is only a
+# margin for writers outside ops_job_run bookkeeping / clock skew.
+WATERMARK_LAG_SECONDS = int(os.environ.get("TRANSFORM_WATERMARK_LAG_SECONDS", "300"))
+WATERMARK_STALE_RUN_HOURS = int(os.environ.get("TRANSFORM_WATERMARK_STALE_RUN_HOURS", "24"))
+
+# --incremental: one pass (one statement, one transaction) covers at most
+# this much ingested_at; a backlog is worked off in consecutive passes
+INCREMENTAL_SLICE_HOURS = float(os.environ.get("TRANSFORM_INCREMENTAL_SLICE_HOURS", "6"))
+
+# The raw rows a transform turns into facts, mapped to surrogate keys
+SQL_FACT_SRC_TEMPLATE = """
+  select
+    s.station_id,
+    m.metric_id,
+    r.observed_at,
+    r.value_num,
+    r.source,
+    r.ingested_at,
+    (r.ingested_at > r.observed_at + interval '24 hours') as is_late,
+    r.ingest_run_id
+  from public.raw_observations r
+  join public.dim_station s
+    on s.station_external_id = r.station_external_id
+   and s.is_current = true
+  join public.dim_metric m
+    on m.metric_code = r.metric_code
+  where r.value_num is not null
+    and {run_filter}"""
 
-SQL_INSERT_ONE_RUN = """
-insert into public.fact_observation
-  (station_id, metric_id, observed_at, value_num, source, ingested_at, is_late, ingest_run_id)
+# Change-aware upsert: a conflicting row is only rewritten when value,
+# source or lateness actually differ, so re-transforming a run does not
+# churn fact_observation. Returns one row per ingest run:
+#   (ingest_run_id, source_rows, inserted, updated); unchanged = the rest
+SQL_INSERT_FACT_TEMPLATE = """
+with src as (""" + SQL_FACT_SRC_TEMPLATE + """
+),{stats}
+upserted as (
+  insert into public.fact_observation
+    (station_id, metric_id, observed_at, value_num, source, ingested_at, is_late, ingest_run_id)
+  select
+    station_id, metric_id, observed_at, value_num, source, ingested_at, is_late, ingest_run_id
+  from src
+  on conflict (station_id, metric_id, observed_at)
+  do update set
+    value_num     = excluded.value_num,
+    source        = excluded.source,
+    ingested_at   = excluded.ingested_at,
+    is_late       = excluded.is_late,
+    ingest_run_id = excluded.ingest_run_id
+  where (fact_observation.value_num, fact_observation.source, fact_observation.is_late)
+        is distinct from
+        (excluded.value_num, excluded.source, excluded.is_late)
+  returning ingest_run_id, (xmax = 0) as inserted_row
+)
 select
-  s.station_id,
-  m.metric_id,
-  r.observed_at,
-  r.value_num,
-  r.source,
-  r.ingested_at,
-  (r.ingested_at > r.observed_at + interval '24 hours') as is_late,
-  r.ingest_run_id
-from public.raw_observations r
-join public.dim_station s
-  on s.station_external_id = r.station_external_id
- and s.is_current = true
-join public.dim_metric m
-  on m.metric_code = r.metric_code
-where r.value_num is not null
-  and r.ingest_run_id = %s
-on conflict (station_id, metric_id, observed_at)
-do update set
-  value_num     = excluded.value_num,
-  source        = excluded.source,
-  ingested_at   = excluded.ingested_at,
-  is_late       = excluded.is_late,
-  ingest_run_id = excluded.ingest_run_id;
+  s.ingest_run_id,
+  s.source_rows,
+  coalesce(u.inserted, 0) as inserted,
+  coalesce(u.updated, 0) as updated
+from (
+  select ingest_run_id, count(*) as source_rows
+  from src
+  group by ingest_run_id
+) s
+left join (
+  select
+    ingest_run_id,
+    count(*) filter (where inserted_row) as inserted,
+    count(*) filter (where not inserted_row) as updated
+  from upserted
+  group by ingest_run_id
+) u using (ingest_run_id);
 """
 
+# Per-run, per-metric stats (ops_run_metric_stats, stage 'fact') from the
+# same src rows: replacing when src holds whole runs (per run / --batch),
+# adding up when it holds slices of runs (--incremental)
+_SQL_FACT_STATS_INSERT = """
+stats as (
+  insert into public.ops_run_metric_stats
+    (run_id, stage, metric_code, rows_total, value_nulls, value_min, value_max,
+     value_sum, value_sumsq, below_min, above_max, late_rows, updated_at)
+  select
+    src.ingest_run_id,
+    'fact',
+    m.metric_code,
+    count(*),
+    count(*) filter (where src.value_num is null),
+    min(src.value_num),
+    max(src.value_num),
+    coalesce(sum(src.value_num), 0),
+    coalesce(sum(src.value_num * src.value_num), 0),
+    count(*) filter (where src.value_num < m.min_expected),
+    count(*) filter (where src.value_num > m.max_expected),
+    count(*) filter (where src.is_late),
+    now()
+  from src
+  join public.dim_metric m
+    on m.metric_id = src.metric_id
+  group by src.ingest_run_id, m.metric_code"""
+
+SQL_FACT_STATS_CTE = _SQL_FACT_STATS_INSERT + SQL_REPLACE_METRIC_STATS_ON_CONFLICT + "),"
+SQL_FACT_STATS_ADD_CTE = _SQL_FACT_STATS_INSERT + SQL_ADD_METRIC_STATS_ON_CONFLICT + "),"
+
+SQL_INSERT_ONE_RUN = SQL_INSERT_FACT_TEMPLATE.format(
+    run_filter="r.ingest_run_id = %s",
+    stats=SQL_FACT_STATS_CTE,
+)
+
+# --batch: many runs in one statement. A raw row belongs to exactly one
+# ingest run, so batching cannot make ON CONFLICT hit a fact row twice.
+SQL_INSERT_MANY_RUNS = SQL_INSERT_FACT_TEMPLATE.format(
+    run_filter="r.ingest_run_id = any(%s::uuid[])",
+    stats=SQL_FACT_STATS_CTE,
+)
+
+# --incremental: every raw row written (inserted or changed, both set
+# ingested_at) in (watermark_from, watermark_to], whatever run wrote it,
+# except runs that already have their TRANSFORM_JOB_NAME child (ingest
+# --fused, or transformed per run / --batch): their facts and 'fact'
+# stats are written, and adding this window's slice would count them twice
+SQL_INSERT_SINCE_WATERMARK = SQL_INSERT_FACT_TEMPLATE.format(
+    run_filter=(
+        "r.ingested_at > coalesce(%(wm_from)s, '-infinity'::timestamptz)\n"
+        "    and r.ingested_at <= %(wm_to)s\n"
+        "    and not exists (\n"
+        "      select 1\n"
+        "      from public.ops_job_run t\n"
+        "      where t.parent_run_id = r.ingest_run_id\n"
+        "        and t.job_name = %(transform)s\n"
+        "    )"
+    ),
+    # each raw write falls in exactly one window, so the slices add up per run
+    stats=SQL_FACT_STATS_ADD_CTE,
+)
+
+NO_ROWS = (0, 0, 0)
+
+def fetch_run_counts(cur) -> dict:
+    """Result of SQL_INSERT_* -> {ingest_run_id: (inserted, updated, unchanged)}."""
+    return {
+        str(run_id): (inserted, updated, source_rows - inserted - updated)
+        for run_id, source_rows, inserted, updated in cur.fetchall()
+    }
+
+def total_counts(counts: dict) -> tuple:
+    return tuple(sum(c[i] for c in counts.values()) for i in range(3))
+
 def start_job(cur, job_name: str, parent_run_id=None) -> str:
     cur.execute(
         """
@@ -54,22 +188,279 @@ def start_job(cur, job_name: str, parent_run_id=None) -> str:
     )
     return cur.fetchone()[0]
 
-def finish_job(cur, run_id: str, status: str, rows_upserted: int, error_message=None):
+def finish_job(cur, run_id: str, status: str, counts: tuple = NO_ROWS, error_message=None):
+    """counts: (inserted, updated, unchanged); unchanged goes to rows_deduped."""
+    rows_inserted, rows_updated, rows_deduped = counts
     cur.execute(
         """
         update public.ops_job_run
            set status = %s,
                ended_at = now(),
                rows_inserted = %s,
+               rows_updated = %s,
+               rows_deduped = %s,
                error_message = %s
          where run_id = %s
         """,
-        (status, rows_upserted, error_message, run_id),
+        (status, rows_inserted, rows_updated, rows_deduped, error_message, run_id),
+    )
+
+def start_jobs(cur, job_name: str, parent_run_ids: list) -> dict:
+    """One 'started' child run per parent, in one statement. Returns {parent_run_id: run_id}."""
+    rows = execute_values(
+        cur,
+        """
+        insert into public.ops_job_run
+          (job_name, status, started_at, parent_run_id)
+        values %s
+        returning parent_run_id, run_id
+        """,
+        [(job_name, str(p)) for p in parent_run_ids],
+        template="(%s, 'started', now(), %s::uuid)",
+        fetch=True,
+    )
+    return {str(parent): run_id for parent, run_id in rows}
+
+def finish_jobs(cur, results: list):
+    """results: [(run_id, status, counts, error_message)], one UPDATE for all."""
+    execute_values(
+        cur,
+        """
+        update public.ops_job_run j
+           set status = v.status,
+               ended_at = now(),
+               rows_inserted = v.rows_inserted,
+               rows_updated = v.rows_updated,
+               rows_deduped = v.rows_deduped,
+               error_message = v.error_message
+          from (values %s)
+            as v (run_id, status, rows_inserted, rows_updated, rows_deduped, error_message)
+         where j.run_id = v.run_id::uuid
+        """,
+        [(str(run_id), status, *counts, err) for run_id, status, counts, err in results],
+        template="(%s, %s, %s::int, %s::int, %s::int, %s::text)",
+    )
+
+def transform_runs_batch(conn, ingest_run_ids: list) -> dict:
+    """
+    --batch: transform many ingest runs with ONE insert statement.
+    Still writes one child transform ops_job_run per ingest run (so DQ's
+    eligibility check is unchanged), each with its own row count.
+    Three commits per batch instead of three per run.
+    """
+    with conn.cursor() as cur:
+        children = start_jobs(cur, TRANSFORM_JOB_NAME, ingest_run_ids)
+    conn.commit()
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SQL_INSERT_MANY_RUNS, ([str(r) for r in ingest_run_ids],))
+            counts = fetch_run_counts(cur)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        with conn.cursor() as cur:
+            err = f"{type(e).__name__}: {e}"[:4000]
+            finish_jobs(cur, [(run_id, "failed", NO_ROWS, err) for run_id in children.values()])
+        conn.commit()
+        raise
+
+    with conn.cursor() as cur:
+        finish_jobs(
+            cur,
+            [(children[str(r)], "succeeded", counts.get(str(r), NO_ROWS), None)
+             for r in ingest_run_ids],
+        )
+    conn.commit()
+    return counts
+
+def load_watermark(cur):
+    """watermark_to of the last succeeded incremental run (None = never ran)."""
+    cur.execute(
+        """
+        select watermark_to
+        from public.ops_job_run
+        where job_name = %s
+          and status = 'succeeded'
+          and watermark_to is not null
+        order by ended_at desc
+        limit 1
+        """,
+        (TRANSFORM_INCREMENTAL_JOB_NAME,),
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def initial_watermark(cur):
+    """
+    Where the first --incremental pass starts when no incremental run has
+    succeeded yet: the end of the last succeeded per-run / --batch
+    transform (runs before it are transformed already; anything older
+    still pending is picked up by --batch). None on a fresh deployment.
+    """
+    cur.execute(
+        """
+        select max(ended_at)
+        from public.ops_job_run
+        where job_name = %s
+          and status = 'succeeded'
+        """,
+        (TRANSFORM_JOB_NAME,),
+    )
+    return cur.fetchone()[0]
+
+def next_watermark(cur):
+    """
+    now() - WATERMARK_LAG_SECONDS, capped at the start of the oldest ingest
+    run (or shard) that is still writing.
+    """
+    cur.execute(
+        """
+        select least(
+          now() - make_interval(secs => %(lag)s),
+          (
+            select min(started_at)
+            from public.ops_job_run
+            where (job_name = %(ingest)s or job_name like %(shard)s)
+              and status = 'started'
+              and started_at > now() - make_interval(hours => %(stale)s)
+          )
+        )
+        """,
+        {
+            "lag": WATERMARK_LAG_SECONDS,
+            "ingest": INGEST_JOB_NAME,
+            "shard": INGEST_SHARD_JOB_PATTERN,
+            "stale": WATERMARK_STALE_RUN_HOURS,
+        },
+    )
+    return cur.fetchone()[0]
+
+def get_ingest_runs_closed_in(cur, wm_from, wm_to):
+    """
+    Ingest runs that finished inside (wm_from, wm_to]: all of their raw rows
+    are at or below wm_to, so they are fully transformed and get their child
+    transform run now. Bounded by the window, not by the size of ops_job_run.
+    """
+    cur.execute(
+        """
+        select i.run_id
+        from public.ops_job_run i
+        where i.job_name = %(ingest)s
+          and i.status = 'succeeded'
+          and i.ended_at > coalesce(%(wm_from)s, '-infinity'::timestamptz)
+          and i.ended_at <= %(wm_to)s
+          and not exists (
+              select 1
+              from public.ops_job_run t
+              where t.parent_run_id = i.run_id
+                and t.job_name = %(transform)s
+          )
+          and not exists (
+              select 1
+              from public.ops_job_run sh
+              where sh.parent_run_id = i.run_id
+                and sh.job_name like %(shard)s
+              group by sh.job_name
+              having not bool_or(sh.status = 'succeeded')
+          )
+        order by i.started_at;
+        """,
+        {
+            "ingest": INGEST_JOB_NAME,
+            "shard": INGEST_SHARD_JOB_PATTERN,
+            "transform": TRANSFORM_JOB_NAME,
+            "wm_from": wm_from,
+            "wm_to": wm_to,
+        },
     )
+    return [r[0] for r in cur.fetchall()]
+
+def transform_incremental(conn, since=None) -> tuple[dict, bool]:
+    """
+    --incremental: one pass over raw rows past the high-water mark on
+    raw_observations.ingested_at, whatever run wrote it. Returns
+    (counts, caught_up); caught_up is False while a backlog remains.
+
+    The watermark lives on the driver run (TRANSFORM_INCREMENTAL_JOB_NAME)
+    in watermark_from/watermark_to; the next run starts from the last
+    succeeded watermark_to (or `since`, or initial_watermark() the first
+    time) and covers at most INCREMENTAL_SLICE_HOURS. Ingest runs that
+    ended inside the window get their child TRANSFORM_JOB_NAME run (rows =
+    rows of that run transformed in this pass), which is what run_dq
+    looks for.
+    """
+    with conn.cursor() as cur:
+        driver_run_id = start_job(cur, TRANSFORM_INCREMENTAL_JOB_NAME)
+        wm_from = since or load_watermark(cur)
+        if wm_from is None:
+            wm_from = initial_watermark(cur)
+        limit = next_watermark(cur)
+
+        start = wm_from
+        if start is None:
+            cur.execute("select min(ingested_at) from public.raw_observations")
+            start = cur.fetchone()[0]
+        wm_to = limit
+        if start is not None:
+            wm_to = min(limit, start + timedelta(hours=INCREMENTAL_SLICE_HOURS))
+        if wm_from is not None and wm_to < wm_from:
+            wm_to = wm_from  # an ingest started before the last cut is still open
+        caught_up = wm_to >= limit or (wm_from is not None and wm_to == wm_from)
+        cur.execute(
+            """
+            update public.ops_job_run
+               set watermark_from = %s,
+                   watermark_to = %s
+             where run_id = %s
+            """,
+            (wm_from, wm_to, driver_run_id),
+        )
+    conn.commit()
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                SQL_INSERT_SINCE_WATERMARK,
+                {"wm_from": wm_from, "wm_to": wm_to, "transform": TRANSFORM_JOB_NAME},
+            )
+            counts = fetch_run_counts(cur)
+
+            closed = get_ingest_runs_closed_in(cur, wm_from, wm_to)
+            if closed:
+                children = start_jobs(cur, TRANSFORM_JOB_NAME, closed)
+                finish_jobs(
+                    cur,
+                    [(children[str(r)], "succeeded", counts.get(str(r), NO_ROWS), None)
+                     for r in closed],
+                )
+
+            finish_job(cur, driver_run_id, "succeeded", total_counts(counts))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        with conn.cursor() as cur:
+            finish_job(
+                cur, driver_run_id, "failed",
+                error_message=f"{type(e).__name__}: {e}"[:4000],
+            )
+        conn.commit()
+        raise
+
+    inserted, updated, unchanged = total_counts(counts)
+    print(
+        f"watermark {wm_from} -> {wm_to}: inserted={inserted} updated={updated} "
+        f"unchanged={unchanged}, {len(closed)} ingest runs closed"
+    )
+    return counts, caught_up
 
 def get_pending_ingest_runs(cur):
     """
     Find all successful ingest runs that have NOT yet been transformed.
+
+    Sharded ingest (`jobs.ingest --shard i/n`) runs under a parent ingest
+    run; the parent only counts as complete when every shard job under it
+    has succeeded (a shard still failed or mid-retry holds it back).
     """
     cur.execute(
         """
@@ -81,9 +472,17 @@ def get_pending_ingest_runs(cur):
         where i.job_name = %s
           and i.status = 'succeeded'
           and t.run_id is null
+          and not exists (
+              select 1
+              from public.ops_job_run sh
+              where sh.parent_run_id = i.run_id
+                and sh.job_name like %s
+              group by sh.job_name
+              having not bool_or(sh.status = 'succeeded')
+          )
         order by i.started_at;
         """,
-        (TRANSFORM_JOB_NAME, INGEST_JOB_NAME),
+        (TRANSFORM_JOB_NAME, INGEST_JOB_NAME, INGEST_SHARD_JOB_PATTERN),
     )
     return [r[0] for r in cur.fetchall()]
 
@@ -97,10 +496,33 @@ def main() -> int:
             return 2
         run_id_arg = sys.argv[i + 1]
 
+    # --incremental --since TS: start from TS instead of the stored watermark
+    since = None
+    if "--since" in sys.argv:
+        i = sys.argv.index("--since")
+        if i + 1 >= len(sys.argv):
+            print("Missing value for --since", file=sys.stderr)
+            return 2
+        try:
+            since = datetime.fromisoformat(sys.argv[i + 1])
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+
     conn = psycopg2.connect(DATABASE_URL)
     conn.autocommit = False
 
     try:
+        if "--incremental" in sys.argv and not run_id_arg:
+            caught_up = False
+            while not caught_up:
+                _, caught_up = transform_incremental(conn, since)
+                since = None
+            print("OK")
+            return 0
+
         with conn.cursor() as cur:
             if run_id_arg:
                 ingest_run_ids = [run_id_arg]
@@ -111,6 +533,17 @@ def main() -> int:
             print("No pending ingest runs to transform.")
             return 0
 
+        if "--batch" in sys.argv:
+            for i in range(0, len(ingest_run_ids), TRANSFORM_BATCH_SIZE):
+                batch = ingest_run_ids[i:i + TRANSFORM_BATCH_SIZE]
+                inserted, updated, unchanged = total_counts(transform_runs_batch(conn, batch))
+                print(
+                    f"batch of {len(batch)} runs: inserted={inserted} "
+                    f"updated={updated} unchanged={unchanged}"
+                )
+            print("OK")
+            return 0
+
         for ingest_run_id in ingest_run_ids:
             with conn.cursor() as cur:
                 transform_run_id = start_job(
@@ -122,11 +555,11 @@ def main() -> int:
 
             with conn.cursor() as cur:
                 cur.execute(SQL_INSERT_ONE_RUN, (ingest_run_id,))
-                affected = cur.rowcount or 0
+                counts = fetch_run_counts(cur).get(str(ingest_run_id), NO_ROWS)
                 conn.commit()
 
             with conn.cursor() as cur:
-                finish_job(cur, transform_run_id, "succeeded", affected)
+                finish_job(cur, transform_run_id, "succeeded", counts)
                 conn.commit()
 
         print("OK")
@@ -139,7 +572,7 @@ def main() -> int:
             conn.rollback()
             with conn.cursor() as cur:
                 fail_run_id = start_job(cur, "transform_raw_to_fact_failed")
-                finish_job(cur, fail_run_id, "failed", 0, err + "\n" + tb[:4000])
+                finish_job(cur, fail_run_id, "failed", error_message=err + "\n" + tb[:4000])
                 conn.commit()
         except Exception:
             pass
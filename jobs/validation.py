@@ -0,0 +1,68 @@
+# ============================================
+# jobs/validation.py
+# Row contract + range validation for ingest batches (docs/data_contracts.md)
+# ============================================
+
+from jobs.dim_cache import DimensionCache
+
+QUALITY_CONTRACT = "contract_violation"    # not exactly one of value_num / value_text
+QUALITY_UNKNOWN_METRIC = "unknown_metric"  # metric_code not in dim_metric
+QUALITY_OUT_OF_RANGE = "out_of_range"      # outside min_expected / max_expected
+
+
+def validate_rows(rows: list[dict], dims: DimensionCache) -> dict:
+    """
+    Set quality_flag on a whole batch in place and return counts.
+
+    Column-at-a-time: metric codes, values and bounds are pulled out as
+    lists, bounds are resolved for the batch in one cache lookup, and the
+    flag column is computed in one pass. A row keeps quality_flag = None
+    when it passes. Out-of-range values are flagged, never dropped
+    (warnings, not failures).
+    """
+    if not rows:
+        return {}
+
+    codes = [row["metric_code"] for row in rows]
+    nums = [row.get("value_num") for row in rows]
+    has_text = [row.get("value_text") is not None for row in rows]
+    known = dims.metric_ids(codes)
+    bounds = dims.metric_bounds(codes)
+
+    flags = [
+        QUALITY_CONTRACT if (v is None) == (not t)
+        else QUALITY_UNKNOWN_METRIC if metric_id is None
+        else QUALITY_OUT_OF_RANGE if v is not None and (
+            (lo is not None and v < lo) or (hi is not None and v > hi)
+        )
+        else None
+        for v, t, metric_id, (lo, hi) in zip(nums, has_text, known, bounds)
+    ]
+
+    counts = {"validated_rows": len(rows)}
+    for row, flag in zip(rows, flags):
+        row["quality_flag"] = flag
+        if flag is not None:
+            key = f"flagged_{flag}"
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def validate_column(metric_code: str, values: list, numeric: bool, dims: DimensionCache) -> list:
+    """
+    Flags for one metric's column of non-null values (backfill's
+    StationColumns): same rules as validate_rows, with the metric resolved
+    and its bounds looked up once for the whole column. A non-null value
+    always satisfies the row contract.
+    """
+    if dims.metric_ids([metric_code])[0] is None:
+        return [QUALITY_UNKNOWN_METRIC] * len(values)
+    if not numeric:
+        return [None] * len(values)
+    lo, hi = dims.metric_bounds([metric_code])[0]
+    if lo is None and hi is None:
+        return [None] * len(values)
+    return [
+        QUALITY_OUT_OF_RANGE if (lo is not None and v < lo) or (hi is not None and v > hi) else None
+        for v in values
+    ]
@@ -1,14 +1,17 @@
  SELECT s.station_id,
     s.station_name,
-    max(f.observed_at) AS last_observed_at,
-    (now() - max(f.observed_at)) AS staleness,
+    l.last_observed_at,
+    (now() - l.last_observed_at) AS staleness,
         CASE
-            WHEN (max(f.observed_at) IS NULL) THEN 'MISSING'::text
-            WHEN ((now() - max(f.observed_at)) > '02:00:00'::interval) THEN 'STALE'::text
+            WHEN (l.last_observed_at IS NULL) THEN 'MISSING'::text
+            WHEN ((now() - l.last_observed_at) > '02:00:00'::interval) THEN 'STALE'::text
             ELSE 'FRESH'::text
         END AS freshness,
-    max(f.observed_at) AS last_seen
+    l.last_observed_at AS last_seen
    FROM (dim_station s
-     LEFT JOIN fact_observation f ON ((f.station_id = s.station_id)))
-  WHERE ((s.is_current = true) AND (s.is_smoketest = false))
-  GROUP BY s.station_id, s.station_name;
\ No newline at end of file
+     CROSS JOIN LATERAL ( SELECT COALESCE(( SELECT max(f.observed_at) AS max
+                   FROM fact_observation f
+                  WHERE ((f.station_id = s.station_id) AND (f.observed_at >= (now() - '7 days'::interval)))), ( SELECT max(f.observed_at) AS max
+                   FROM fact_observation f
+                  WHERE (f.station_id = s.station_id))) AS last_observed_at) l)
+  WHERE ((s.is_current = true) AND (s.is_smoketest = false));
@@ -0,0 +1,14 @@
+ SELECT r.id,
+    r.source,
+    r.station_external_id,
+    r.observed_at,
+    r.metric_code,
+    r.value_num,
+    r.value_text,
+    r.unit,
+    r.quality_flag,
+    (COALESCE(c.context, '{}'::jsonb) || r.source_payload) AS source_payload,
+    r.ingested_at,
+    r.ingest_run_id
+   FROM (raw_observations r
+     LEFT JOIN raw_observation_context c ON (((c.ingest_run_id = r.ingest_run_id) AND (c.source = r.source) AND (c.station_external_id = r.station_external_id) AND (c.observed_at = r.observed_at))));